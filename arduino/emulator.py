@@ -0,0 +1,309 @@
+"""
+Software stand-in for the Arduino running optimize_temp.ino and the stirrer sketch, so Heater,
+Stirrer and Wrapper can run without hardware.
+
+It speaks the same byte protocol:
+    0x01 <pwm>   set the heating pad's PWM duty, 0-255
+    0x02         reply with the thermistor reading, a big-endian unsigned short
+    0x03 <stir>  set the stirrer
+
+The heating pad is a first-order system driven by the PWM duty, and the thermistor follows the
+pad with its own, shorter time constant. Both run on a simulated clock that is either only
+advanced by sleep(), so an optimization finishes as fast as the CPU allows, or runs a fixed
+factor faster than real time.
+
+The reply is the divider voltage scaled to 16 bits, which is what Heater decodes. The sketch
+itself sums 255 10-bit readings into an unsigned int.
+
+Usage:
+    python emulator.py serve --speedup 60       serve the emulator on a pty, for a real Serial
+    python emulator.py step --pwm 255 -n 300    print the readings of a step response
+"""
+import math
+import random
+import threading
+import time
+from heater import (BETA, FULL_SCALE, NOMINAL_TEMPERATURE, READ_TEMPERATURE, SERIES_RESISTANCE,
+                    SET_PWM, SUPPLY_VOLTAGE, Heater)
+
+SET_STIR = b"\x03"
+
+def celsius_to_reading(temp_celsius):
+    """
+    The 16-bit reading the thermistor divider gives at a temperature; inverse of
+    heater.reading_to_celsius.
+    """
+    resistance = SERIES_RESISTANCE * math.exp(
+        BETA * (1.0 / (temp_celsius + 273.15) - 1.0 / NOMINAL_TEMPERATURE))
+    voltage = SUPPLY_VOLTAGE * resistance / (resistance + SERIES_RESISTANCE)
+    return min(max(round(voltage / SUPPLY_VOLTAGE * FULL_SCALE), 1), FULL_SCALE - 1)
+
+class SimulatedClock:
+    """
+    Seconds of simulated time. Callable like time.monotonic, with a matching sleep().
+    """
+    def __init__(self, speedup: float = None):
+        """
+        :param speedup: how many times faster than real time the clock runs, or None for a
+            clock that only moves when sleep() is called
+        """
+        self.speedup = speedup
+        self._now = 0.0
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self.speedup is None:
+            with self._lock:
+                return self._now
+        return (time.monotonic() - self._start) * self.speedup
+
+    def sleep(self, seconds):
+        if self.speedup is None:
+            with self._lock:
+                self._now += max(seconds, 0.0)
+        else:
+            time.sleep(seconds / self.speedup)
+
+class ThermalModel:
+    """
+    Heating pad and thermistor as two first-order lags in series:
+        pad:        tau_pad    * dT_pad/dt    = ambient + max_rise * pwm / 255 - T_pad
+        thermistor: tau_sensor * dT_sensor/dt = T_pad - T_sensor
+    advance() solves both exactly for a constant PWM, so the step size does not matter.
+    """
+    def __init__(self, ambient: float = 22.0, max_rise: float = 60.0, tau_pad: float = 120.0,
+                 tau_sensor: float = 10.0, noise: float = 0.05, seed: int = None):
+        """
+        :param ambient: temperature of the room and of the pad at rest, in degrees Celsius
+        :param max_rise: how far above ambient the pad settles at full PWM
+        :param tau_pad: time constant of the pad in seconds
+        :param tau_sensor: time constant of the thermistor in seconds
+        :param noise: standard deviation of the measurement noise in degrees
+        :param seed: seed of the measurement noise, for repeatable runs
+        """
+        self.ambient = ambient
+        self.max_rise = max_rise
+        self.tau_pad = tau_pad
+        self.tau_sensor = tau_sensor
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.pwm = 0
+        self.pad = ambient
+        self.sensor = ambient
+
+    def advance(self, seconds):
+        """
+        Let the temperatures evolve under the current PWM.
+        """
+        if seconds <= 0:
+            return
+        steady = self.ambient + self.max_rise * self.pwm / 255
+        pad = self.pad - steady
+        sensor = self.sensor - steady
+        a, b = self.tau_pad, self.tau_sensor
+        decay_pad = math.exp(-seconds / a)
+        decay_sensor = math.exp(-seconds / b)
+        if math.isclose(a, b):
+            sensor = sensor * decay_sensor + pad * seconds / b * decay_sensor
+        else:
+            sensor = sensor * decay_sensor + pad * a / (a - b) * (decay_pad - decay_sensor)
+        self.pad = steady + pad * decay_pad
+        self.sensor = steady + sensor
+
+    def measure(self):
+        """
+        Thermistor temperature with measurement noise.
+        """
+        return self.sensor + (self.random.gauss(0.0, self.noise) if self.noise else 0.0)
+
+class ArduinoEmulator:
+    """
+    Byte protocol of the sketches on top of a ThermalModel. Commands may be split across writes.
+    """
+    def __init__(self, model: ThermalModel = None, clock=None):
+        """
+        :param clock: simulated time in seconds, by default a SimulatedClock moved by sleep()
+        """
+        self.model = model if model is not None else ThermalModel()
+        self.clock = clock if clock is not None else SimulatedClock()
+        self.stir = 0
+        self._time = self.clock()
+        self._command = None  # command byte waiting for its argument
+        self._lock = threading.Lock()
+
+    def _catch_up(self):
+        now = self.clock()
+        self.model.advance(now - self._time)
+        self._time = now
+
+    def feed(self, data):
+        """
+        Process bytes sent to the Arduino.
+        :return: bytes it sends back
+        """
+        reply = bytearray()
+        with self._lock:
+            for byte in bytes(data):
+                command, self._command = self._command, None
+                if command == SET_PWM:
+                    self._catch_up()
+                    self.model.pwm = byte
+                elif command == SET_STIR:
+                    self.stir = byte
+                elif bytes((byte,)) in (SET_PWM, SET_STIR):
+                    self._command = bytes((byte,))
+                elif bytes((byte,)) == READ_TEMPERATURE:
+                    self._catch_up()
+                    reply += celsius_to_reading(self.model.measure()).to_bytes(2, "big")
+                # anything else is ignored, like the sketch does
+        return bytes(reply)
+
+class FakeSerial:
+    """
+    In-process serial port connected to an ArduinoEmulator, with the parts of pyserial's Serial
+    that Heater, Stirrer and SerialDriver use.
+    """
+    def __init__(self, emulator: ArduinoEmulator = None, timeout: float = 1):
+        self.emulator = emulator if emulator is not None else ArduinoEmulator()
+        self.timeout = timeout
+        self.is_open = True
+        self._input = bytearray()
+        self._condition = threading.Condition()
+
+    @property
+    def in_waiting(self):
+        with self._condition:
+            return len(self._input)
+
+    def write(self, data):
+        if not self.is_open:
+            raise ValueError("Port is closed.")
+        reply = self.emulator.feed(data)
+        if reply:
+            with self._condition:
+                self._input += reply
+                self._condition.notify_all()
+        return len(data)
+
+    def read(self, size=1):
+        """
+        Up to size bytes, fewer if the timeout passes first.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._input) >= size or not self.is_open,
+                                     self.timeout)
+            if not self.is_open:
+                raise ValueError("Port is closed.")
+            data = bytes(self._input[:size])
+            del self._input[:size]
+            return data
+
+    def read_all(self):
+        with self._condition:
+            data = bytes(self._input)
+            self._input.clear()
+            return data
+
+    def reset_input_buffer(self):
+        with self._condition:
+            self._input.clear()
+
+    def close(self):
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+class PtyEmulator:
+    """
+    Serves an ArduinoEmulator on a pseudo-terminal, so it can be opened by name with a real
+    pyserial Serial. POSIX only. Use it as a context manager, or call close().
+    A Heater on the pty should keep time with a clock of the same speedup, e.g.
+    clock = SimulatedClock(60); Heater(pty.port, clock=clock, sleep=clock.sleep).
+    """
+    def __init__(self, emulator: ArduinoEmulator = None):
+        import os
+        import tty
+
+        self.emulator = emulator if emulator is not None else ArduinoEmulator()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="pty-emulator", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _serve(self):
+        import os
+        import select
+
+        while not self._closed.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:  # closed
+                return
+            reply = self.emulator.feed(data)
+            if reply:
+                os.write(self._master, reply)
+
+    def close(self):
+        import os
+
+        self._closed.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+def emulated_heater(model: ThermalModel = None, speedup: float = None, sample_period=2.0,
+                    verbose=False):
+    """
+    Heater connected to an in-process emulator and scheduled on its simulated clock, e.g.
+    Wrapper(controller=emulated_heater()) runs a whole optimization in seconds.
+    :param speedup: see SimulatedClock; None runs as fast as possible
+    """
+    clock = SimulatedClock(speedup)
+    device = FakeSerial(ArduinoEmulator(model, clock))
+    return Heater(sample_period=sample_period, clock=clock, sleep=clock.sleep, device=device,
+                  verbose=verbose)
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Emulate the heater and stirrer Arduino.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="serve the emulator on a pty")
+    serve_parser.add_argument("--speedup", type=float, default=1.0,
+                              help="how many times faster than real time to simulate")
+    step_parser = subparsers.add_parser("step", help="print the readings of a step response")
+    step_parser.add_argument("--pwm", type=int, default=255, help="PWM duty, 0-255")
+    step_parser.add_argument("-n", "--steps", type=int, default=300, help="number of readings")
+    for subparser in (serve_parser, step_parser):
+        subparser.add_argument("--seed", type=int, default=None, help="seed of the noise")
+    args = parser.parse_args(argv)
+
+    model = ThermalModel(seed=args.seed)
+    if args.command == "serve":
+        emulator = ArduinoEmulator(model, SimulatedClock(args.speedup))
+        with PtyEmulator(emulator) as pty:
+            print(f"Emulating the Arduino on {pty.port}; stop with Ctrl+C.")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+    else:
+        heater = emulated_heater(model, verbose=True)
+        heater.write_and_read([args.pwm] * args.steps)
+        heater.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,138 @@
-from serial import Serial
 from struct import unpack, pack
 import time
 import math
+from serial_driver import SerialDriver
+
+# commands of optimize_temp.ino
+SET_PWM = b"\x01"
+READ_TEMPERATURE = b"\x02"
+
+# the thermistor sits in a divider with a 10 kOhm resistor across 5 V, and the Arduino replies
+# with the divider voltage as a big-endian unsigned short
+SUPPLY_VOLTAGE = 5.0
+FULL_SCALE = 0xffff
+SERIES_RESISTANCE = 10000
+BETA = 3435
+NOMINAL_TEMPERATURE = 298  # kelvin at which the thermistor measures SERIES_RESISTANCE
+
+def reading_to_celsius(reading):
+    """
+    Temperature of the thermistor from the Arduino's 16-bit reading.
+    """
+    voltage = reading * SUPPLY_VOLTAGE / FULL_SCALE
+    resistance = SERIES_RESISTANCE / (SUPPLY_VOLTAGE / voltage - 1.0)
+    # thermistor equation using the beta value to find the temp
+    temp_kelvin = 1.0 / (math.log(resistance / SERIES_RESISTANCE) / BETA
+                         + 1.0 / NOMINAL_TEMPERATURE)
+    return temp_kelvin - 273.15
 
 # send pwm sequence, read temperature values
 class Heater:
     """
     Class for heaters using Arduino
     """
-    def __init__(self, com: str = None):
+    def __init__(self, com: str = None, sample_period: float = 2.0, timeout: float = 1.0,
+                 clock=time.monotonic, sleep=time.sleep, device=None, verbose: bool = True,
+                 retries: int = 2):
+        """
+        :param sample_period: seconds each PWM value is applied for, and between readings
+        :param timeout: seconds to wait for the reply to a temperature reading
+        :param retries: how many more times a reading is asked for when its reply is lost
+        :param clock: monotonic clock the readings are scheduled on, in seconds
+        :param sleep: waits for a number of seconds of that clock
+        :param device: an already open serial device, e.g. an emulator.FakeSerial, instead of
+            connecting to com
+        :param verbose: print every PWM value and the temperature it gave
+        """
         self.device = None
-        self.connect_arduino(com)
+        self.driver = None
+        self.sample_period = sample_period
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.verbose = verbose
+        self.retries = retries
+        if device is None:
+            self.connect_arduino(com)
+        else:
+            self.device = device
+            self.driver = SerialDriver(device)
 
     def connect_arduino(self, com: str = None):
         """
         Creates serial connection
         """
+        from serial import Serial
+
         if com is None:
             self.device = Serial("COM5", baudrate=9600, timeout=1)
         else:
             self.device = Serial(com, baudrate=9600, timeout=1)
-        time.sleep(2)
+        time.sleep(2)  # the Arduino restarts when the port is opened
+        self.device.reset_input_buffer()
+        self.driver = SerialDriver(self.device)
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.close()
+
+    def read_temperature(self):
+        """
+        Read the thermistor once.
+        :return: temperature in degrees Celsius
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                _, reply = self.driver.request(READ_TEMPERATURE, self.timeout)
+                break
+            except TimeoutError:
+                if attempt == self.retries:
+                    raise
+        return reading_to_celsius(unpack(">H", reply)[0])  # big-endian for unsigned short
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def stream(self, seq):
+        """
+        Apply each PWM value of seq for sample_period seconds and yield the temperature at the end
+        of it, as soon as it is read. Commands are sent on a fixed clock, so reading i is taken
+        (i + 1) * sample_period after the first PWM value was applied however long each round
+        trip takes. Stop iterating to stop the sequence early; the PWM value of the last reading
+        stays applied until the next command, e.g. cool_down().
+        """
+        start = self.clock()
+        for i in range(len(seq) + 1):
+            self._wait_until(start + i * self.sample_period)
+            if i > 0:
+                temp_celsius = self.read_temperature()
+                if self.verbose:
+                    print(seq[i - 1], temp_celsius)
+                yield temp_celsius
+            if i < len(seq):
+                self.driver.send(SET_PWM + pack("B", seq[i]))
 
     def write_and_read(self, seq):
         """
-        Send PWM sequence to Arduino
-        """
-        temp_seq = []
-        for pwm in seq:
-            print(pwm)
-            # write
-            self.device.write(b"\x01")
-            self.device.write(pack("B", pwm))
-            time.sleep(3)  # apply each PWM value for 2 seconds
-
-            # read
-            self.device.write(b"\x02")
-            time.sleep(3)
-            analog = self.device.read_all()
-            voltage = int(unpack(">H", analog)[0]) * 5 / 0xffff  # big-endian for unsigned short
-            resistance = 10000 / (5.0 / voltage - 1.0)
-            # thermistor equation using 3435 beta value to find the temp
-            temp_kelvin = 1.0 / (math.log(resistance / 10000) / 3435 + 1.0 / 298)
-            temp_celsius = temp_kelvin - 273.15
-            print(temp_celsius)
-            temp_seq.append(temp_celsius)
-
-        return temp_seq
+        Run a whole PWM sequence, see stream().
+        :return: the temperature in degrees Celsius after each PWM value
+        """
+        return list(self.stream(seq))
+
+    def cool_down(self, temperature, timeout: float = 300):
+        """
+        Switch the heater off and wait until the thermistor reads at most temperature, checking
+        every sample_period, or until timeout seconds have passed.
+        :return: the last temperature read
+        """
+        self.driver.send(SET_PWM + pack("B", 0))
+        start = self.clock()
+        i = 0
+        while True:
+            temp_celsius = self.read_temperature()
+            if temp_celsius <= temperature or self.clock() - start >= timeout:
+                return temp_celsius
+            i += 1
+            self._wait_until(start + i * self.sample_period)
@@ -1,8 +1,25 @@
 from wrapper import Wrapper
 
-w = Wrapper()
-best_pwm_seq, best_time = w.run(40)
-print(best_pwm_seq, best_time)
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Optimize the PWM sequence of the heater.")
+    parser.add_argument("--target", type=float, default=40,
+                        help="target temperature in degrees Celsius")
+    parser.add_argument("--emulate", action="store_true",
+                        help="run against the software emulator instead of the Arduino")
+    args = parser.parse_args(argv)
+
+    controller = None
+    if args.emulate:
+        from emulator import emulated_heater
+        controller = emulated_heater()
+    w = Wrapper(controller)
+    best_pwm_seq, best_time = w.run(args.target)
+    print(best_pwm_seq, best_time)
+
+if __name__ == "__main__":
+    main()
 
 # # thermistor test
 # import time
@@ -1,12 +1,25 @@
-from skopt import gp_minimize
-# from sklearn.gaussian_process import GaussianProcessRegressor
+from surrogate import ThermalSurrogate
 
 class Optimizer:
     """
     Class to optimize PWM sequence
     """
-    def __init__(self, wrapper):
+    def __init__(self, wrapper, n_calls: int = 15, n_initial_points: int = 4,
+                 n_candidates: int = 500, surrogate: ThermalSurrogate = None,
+                 random_state: int = 41):
+        """
+        :param n_calls: number of sequences run on the heater
+        :param n_initial_points: runs that explore at random before the GP takes over
+        :param n_candidates: random points screened in simulation against the GP's suggestion
+            before every run
+        :param surrogate: model of the heater fitted from the wrapper's logged runs
+        """
         self.wrapper = wrapper
+        self.n_calls = n_calls
+        self.n_initial_points = n_initial_points
+        self.n_candidates = n_candidates
+        self.surrogate = surrogate if surrogate is not None else ThermalSurrogate()
+        self.random_state = random_state
 
     def objective(self, seq):
         """
@@ -14,11 +27,40 @@ class Optimizer:
         """
         return self.wrapper.evaluate(seq)
 
-    def optimize(self, space):
+    def predict(self, seq):
         """
-        Optimize over the search space
+        Time the surrogate expects a PWM sequence to take, without running it.
+        """
+        return self.wrapper.settling_time(self.surrogate.simulate(seq))
+
+    def optimize(self, parameterization):
         """
-        result = gp_minimize(self.objective, space, n_calls=50, random_state=41)
-        best_pwm_seq = result.x
-        best_time = result.fun
-        return best_pwm_seq, best_time
+        Optimize the PWM value of every segment of the parameterization. The GP proposes the
+        next point as usual, but after the n_initial_points random runs, once the surrogate can
+        be fitted from the logged runs, the proposal competes in simulation with n_candidates
+        random points, and only the one predicted to settle fastest is run on the heater. The
+        initial runs are left alone so the GP and the surrogate see the whole search space.
+        Every run refits the surrogate, and only measured times are given to the GP.
+        :param parameterization: maps points of the search space to PWM sequences, see
+            parameterization.PiecewiseConstant
+        :return: the PWM value of every segment of the best sequence run, and its time
+        """
+        from skopt import Optimizer as BayesianSearch
+
+        search = BayesianSearch(parameterization.space(), base_estimator="GP",
+                                n_initial_points=self.n_initial_points,
+                                random_state=self.random_state)
+        self.surrogate.fit(self.wrapper.runs)  # runs logged by earlier sessions, if any
+        for call in range(self.n_calls):
+            params = search.ask()
+            if call >= self.n_initial_points and self.surrogate.fitted:
+                candidates = [params] + search.space.rvs(self.n_candidates,
+                                                         random_state=self.random_state + call)
+                # ties keep the GP's proposal, which comes first
+                params = min(candidates,
+                             key=lambda point: self.predict(parameterization.sequence(point)))
+            search.tell(params, self.objective(parameterization.sequence(params)))
+            self.surrogate.fit(self.wrapper.runs)
+
+        best = min(range(len(search.yi)), key=search.yi.__getitem__)
+        return search.Xi[best], search.yi[best]
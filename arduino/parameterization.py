@@ -0,0 +1,47 @@
+def segment_bounds(length, segments):
+    """
+    Start of every segment and the end of the last, splitting length steps into segments that
+    double in length, so the early boost is tuned finely and the long hold coarsely.
+    e.g. 300 steps in 5 segments: [0, 10, 29, 68, 145, 300]
+    """
+    if not 0 < segments <= length:
+        raise ValueError(f"Cannot split {length} steps into {segments} segments.")
+    total = 2 ** segments - 1
+    bounds = [round(length * (2 ** k - 1) / total) for k in range(segments + 1)]
+    # very short sequences: keep every segment at least one step long
+    for k in range(1, segments + 1):
+        bounds[k] = max(bounds[k], bounds[k - 1] + 1)
+    for k in range(segments - 1, -1, -1):
+        bounds[k] = min(bounds[k], bounds[k + 1] - 1)
+    return bounds
+
+class PiecewiseConstant:
+    """
+    PWM sequence made of a few constant segments, so the optimizer searches over one PWM value
+    per segment instead of one per step.
+    """
+    def __init__(self, length=300, segments=5, max_pwm=255):
+        """
+        :param length: number of PWM steps of the sequence
+        :param segments: number of constant segments, see segment_bounds
+        """
+        self.length = length
+        self.max_pwm = max_pwm
+        self.bounds = segment_bounds(length, segments)
+
+    def space(self):
+        """
+        skopt search space: one PWM value per segment.
+        """
+        from skopt.space import Integer
+
+        return [Integer(0, self.max_pwm, name=f"pwm_{k}") for k in range(len(self.bounds) - 1)]
+
+    def sequence(self, params):
+        """
+        The PWM value of every step for one point of the search space.
+        """
+        seq = []
+        for pwm, start, end in zip(params, self.bounds, self.bounds[1:]):
+            seq.extend([int(pwm)] * (end - start))
+        return seq
@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+
+class SerialDriver:
+    """
+    Sends commands to an Arduino and collects its fixed-length replies on a background thread,
+    so replies are picked up as soon as they arrive instead of after a fixed sleep.
+    Works with a pyserial Serial, including one opened on a pty, or any object with the same
+    write(), read(size), reset_input_buffer() and close() methods, where read returns fewer
+    bytes on timeout.
+    Use it as a context manager, or call close().
+    """
+    def __init__(self, device, frame_size=2):
+        """
+        :param device: the open serial device; its timeout bounds how long the reader blocks
+        :param frame_size: length in bytes of every reply
+        """
+        self.device = device
+        self.frame_size = frame_size
+        self._replies = queue.Queue()
+        # set by request() after a timeout, cleared by the reader once it dropped partial frames
+        self._resync = threading.Event()
+        self._synced = threading.Event()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._read_loop, name="serial-reader", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_loop(self):
+        frame = bytearray()
+        try:
+            while not self._closed.is_set():
+                if self._resync.is_set():
+                    frame.clear()
+                    self.device.reset_input_buffer()
+                    self._resync.clear()
+                    self._synced.set()
+                data = self.device.read(self.frame_size - len(frame))
+                if not data:
+                    continue
+                frame += data
+                if len(frame) == self.frame_size:
+                    self._replies.put((time.monotonic(), bytes(frame)))
+                    frame.clear()
+        except Exception as e:  # the port went away; request() reports it
+            if not self._closed.is_set():
+                self._error = e
+                self._replies.put(None)
+
+    def send(self, data):
+        """
+        Write a command that has no reply.
+        """
+        with self._write_lock:
+            self.device.write(data)
+
+    def request(self, data, timeout=1.0):
+        """
+        Write a command and wait for its reply. Replies left over from earlier requests are
+        dropped first. If the reply does not come, e.g. because a byte was lost, the input is
+        cleared so the next reply starts a frame again.
+        :return: time.monotonic() at which the reply was received, and the reply
+        """
+        if self._error is not None:
+            raise RuntimeError("The serial port stopped responding.") from self._error
+        self._drain()
+        self.send(data)
+        try:
+            reply = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            self._resynchronize()
+            raise TimeoutError(f"No reply to {data!r} within {timeout} s.") from None
+        if reply is None:
+            raise RuntimeError("The serial port stopped responding.") from self._error
+        return reply
+
+    def _drain(self):
+        while True:
+            try:
+                reply = self._replies.get_nowait()
+            except queue.Empty:
+                return
+            if reply is None:  # keep the reader's error for request() to report
+                self._replies.put(None)
+                return
+
+    def _resynchronize(self):
+        """
+        Drop any partial frame and everything not read yet, waiting for the reader to do so
+        between two reads.
+        """
+        self._synced.clear()
+        self._resync.set()
+        self._synced.wait(timeout=(getattr(self.device, "timeout", None) or 1) + 1)
+        self._drain()
+
+    def close(self):
+        self._closed.set()
+        self.device.close()
+        # the reader notices within the device's read timeout
+        self._thread.join(timeout=5)
@@ -1,16 +1,22 @@
-from serial import Serial
 from struct import pack
 import time
 
 class Stirrer:
-    def __init__(self, com: str = None):
-        self.device = None
-        self.connect_arduino(com)
+    def __init__(self, com: str = None, device=None):
+        """
+        :param device: an already open serial device, e.g. an emulator.FakeSerial, instead of
+            connecting to com
+        """
+        self.device = device
+        if device is None:
+            self.connect_arduino(com)
 
     def connect_arduino(self, com: str = None):
         """
         Creates serial connection
         """
+        from serial import Serial
+
         if com is None:
             self.device = Serial("COM5", baudrate=9600, timeout=1)
         else:
@@ -21,9 +27,13 @@ class Stirrer:
         self.device.write(b"\x03")
         self.device.write(pack("B", stir))
 
-s = Stirrer()
-while True:
-    s.set_stir(0)
-    time.sleep(3)
-    s.set_stir(1)
-    time.sleep(3)
+def main():
+    s = Stirrer()
+    while True:
+        s.set_stir(0)
+        time.sleep(3)
+        s.set_stir(1)
+        time.sleep(3)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Thermal surrogate of the heater fitted from logged runs, so PWM sequences can be screened in
+simulation before one is run on the hardware.
+
+The heater is modelled as a linear difference equation of the readings (an ARX model),
+    T[i] = a_1 T[i-1] + ... + a_n T[i-n] + b u[i] + c
+where u[i] is the PWM value applied before reading i. Order 2 covers the pad and the lag of the
+thermistor. Fitting is a least-squares solve of n + 2 unknowns, and simulating a sequence costs
+a few operations per step.
+"""
+
+def _solve(matrix, vector):
+    """
+    Solve a small linear system by Gaussian elimination with partial pivoting.
+    """
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            raise ValueError("The logged runs do not determine the model; vary the PWM more.")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, size):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, size + 1):
+                rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * size
+    for r in range(size - 1, -1, -1):
+        solution[r] = (rows[r][size] - sum(rows[r][c] * solution[c]
+                                           for c in range(r + 1, size))) / rows[r][r]
+    return solution
+
+class ThermalSurrogate:
+    def __init__(self, order=2):
+        """
+        :param order: number of past readings each reading depends on
+        """
+        self.order = order
+        self.coefficients = None  # a_1 ... a_n, b, c
+        self.initial = None
+
+    @property
+    def fitted(self):
+        return self.coefficients is not None
+
+    def fit(self, runs):
+        """
+        Fit the model to logged runs by least squares.
+        :param runs: (pwm_seq, temp_seq) pairs, where temp_seq[i] was read after pwm_seq[i]
+            was applied; temp_seq may be shorter if the run was stopped early
+        :return: whether enough readings were logged to fit the model
+        """
+        size = self.order + 2
+        normal = [[0.0] * size for _ in range(size)]
+        target = [0.0] * size
+        samples = 0
+        starts = []
+        for pwm_seq, temp_seq in runs:
+            if temp_seq:
+                starts.append(temp_seq[0])
+            for i in range(self.order, len(temp_seq)):
+                row = [temp_seq[i - k] for k in range(1, self.order + 1)] + [pwm_seq[i], 1.0]
+                for r in range(size):
+                    target[r] += row[r] * temp_seq[i]
+                    for c in range(size):
+                        normal[r][c] += row[r] * row[c]
+                samples += 1
+        if samples < 2 * size:
+            return False
+        try:
+            self.coefficients = _solve(normal, target)
+        except ValueError:
+            return False
+        # start simulations where the logged runs started, usually at room temperature
+        self.initial = sum(starts) / len(starts)
+        return True
+
+    def simulate(self, pwm_seq, initial=None):
+        """
+        Predicted reading after each PWM value.
+        :param initial: temperature before the sequence, by default the mean first reading of
+            the logged runs
+        """
+        if not self.fitted:
+            raise RuntimeError("Fit the surrogate to logged runs first.")
+        *history_weights, gain, offset = self.coefficients
+        history = [self.initial if initial is None else initial] * self.order
+        temp_seq = []
+        for pwm in pwm_seq:
+            temp = offset + gain * pwm + sum(w * t for w, t in zip(history_weights, history))
+            history.insert(0, temp)
+            history.pop()
+            temp_seq.append(temp)
+        return temp_seq
@@ -1,51 +1,122 @@
+import json
+import math
+import os
 from heater import Heater
 from optimizer import Optimizer
-from skopt.space import Integer
+from parameterization import PiecewiseConstant
 
 class Wrapper:
     """
     Wrapper for the heater and optimizer
     """
-    def __init__(self):
-        self.controller = Heater()
+    def __init__(self, controller=None, segments: int = 5, log_path=None,
+                 cooldown_margin: float = 3.0, cooldown_timeout: float = 300):
+        """
+        :param controller: the Heater to optimize, by default one on the Arduino's port
+        :param segments: number of constant PWM segments the optimizer tunes
+        :param log_path: JSON lines file of the runs made so far; runs logged by earlier sessions
+            are loaded to fit the optimizer's surrogate, and every new run is appended
+        :param cooldown_margin: after every run the heater is switched off until it is within
+            this many degrees of the temperature it had before the first run, or None to only
+            switch it off
+        :param cooldown_timeout: longest wait for the cooldown, in seconds. The pad cools with a
+            time constant of minutes, so after a run that overshot the next one starts from
+            whatever was reached; the temperature every run started from is logged
+        """
+        self.controller = controller if controller is not None else Heater()
         self.optimizer = Optimizer(self)
         self.target_temp = None
+        self.segments = segments
+        self.tolerance = 1.0  # ±1 degree
+        self.stability_duration = 30  # 30 secs
+        self.max_duration = 5 * 60  # 5 mins
+        self.cooldown_margin = cooldown_margin
+        self.cooldown_timeout = cooldown_timeout
+        self.rest_temp = None  # reading before the first run
+        self.start_temp = None  # reading before the next run
+        self.log_path = log_path
+        # (pwm_seq, temp_seq) of every run, temp_seq[i] read after pwm_seq[i] was applied
+        self.runs = []
+        if log_path is not None and os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as file:
+                for line in file:
+                    run = json.loads(line)
+                    self.runs.append((run["pwm"], run["temperatures"]))
 
-    def evaluate(self, seq):
+    def record(self, seq, temp_seq, start=None):
         """
-        Evaluate the temperatures and time for a given pwm sequence
+        Keep a run for the surrogate, and append it to the log.
+        :param start: temperature read before the run
         """
-        temp_seq = self.controller.write_and_read(seq)
+        self.runs.append((list(seq), list(temp_seq)))
+        if self.log_path is not None:
+            with open(self.log_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps({"pwm": list(seq), "temperatures": list(temp_seq),
+                                       "target": self.target_temp, "start": start}) + "\n")
 
-        # process temperature sequence from heater (rtn) to get the time
-        tolerance = 1.0  # ±1 degree
-        stability_duration = 30  # 30 secs
-        max_duration = 5 * 60  # 20 mins
+    def settling_time(self, temp_seq):
+        """
+        Time a temperature sequence takes to stay within tolerance of the target for
+        stability_duration, or max_duration if it does not. Stops consuming temp_seq, which may be
+        a stream of readings, as soon as the time is known, including when the stability window
+        can no longer end before max_duration.
+        """
+        period = self.controller.sample_period
         stability_start_time = None
 
         for i, temp in enumerate(temp_seq):
-            elapsed_time = i * 2  # each temp reading is 2 seconds apart
+            elapsed_time = i * period
 
-            if elapsed_time >= max_duration:
-                return max_duration
+            if elapsed_time >= self.max_duration:
+                return self.max_duration
 
-            if abs(temp - self.target_temp) <= tolerance:
+            if abs(temp - self.target_temp) <= self.tolerance:
                 if stability_start_time is None:
                     stability_start_time = elapsed_time
-                elif elapsed_time - stability_start_time >= stability_duration:
+                elif elapsed_time - stability_start_time >= self.stability_duration:
                     return elapsed_time
             else:
                 stability_start_time = None
 
-        return max_duration
+            earliest_start = (elapsed_time + period if stability_start_time is None
+                              else stability_start_time)
+            if earliest_start + self.stability_duration >= self.max_duration:
+                return self.max_duration
+
+        return self.max_duration
+
+    def evaluate(self, seq):
+        """
+        Evaluate the temperatures and time for a given pwm sequence
+        """
+        if self.rest_temp is None:
+            self.rest_temp = self.start_temp = self.controller.read_temperature()
+        start = self.start_temp
+        temp_seq = []
+
+        def readings():
+            for temp in self.controller.stream(seq):
+                temp_seq.append(temp)
+                yield temp
+
+        stream = readings()
+        try:
+            return self.settling_time(stream)
+        finally:
+            # stops the heater's sequence where it is
+            stream.close()
+            self.record(seq[:len(temp_seq)], temp_seq, start)
+            margin = math.inf if self.cooldown_margin is None else self.cooldown_margin
+            self.start_temp = self.controller.cool_down(self.rest_temp + margin,
+                                                        self.cooldown_timeout)
 
     def run(self, target_temp):
         """
         Run optimization
         """
         self.target_temp = target_temp
-        pwm = Integer(0, 255)
-        max_sequence_length = 5 * 60  # 20 mins
-        space = [pwm] * max_sequence_length
-        best_pwm_seq, best_time = self.optimizer.optimize(space)
-        return best_pwm_seq, best_time
+        # readings after max_duration cannot change the time, so neither can their PWM values
+        max_sequence_length = math.ceil(self.max_duration / self.controller.sample_period) + 1
+        parameterization = PiecewiseConstant(max_sequence_length, self.segments)
+        best_params, best_time = self.optimizer.optimize(parameterization)
+        return parameterization.sequence(best_params), best_time
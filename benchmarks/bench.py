@@ -0,0 +1,257 @@
+"""
+Benchmarks for labware generation, verification, status I/O and CSV parsing.
+
+Every case is timed with timeit (median of several repeats, per call) and compared with the
+committed baseline in benchmarks/baseline.json. The speed of a shared machine drifts by more than
+any useful threshold, so a small fixed workload is timed next to every case and the case is
+scaled by how much slower than in the baseline that workload ran. A case slower than its baseline
+by more than the threshold is measured again, and is reported as a regression and makes the run
+fail only if it is still that slow every time. Cases under a millisecond get a wider threshold.
+
+Usage:
+    python benchmarks/bench.py                 compare with the baseline
+    python benchmarks/bench.py -k verify       only the cases whose name contains 'verify'
+    python benchmarks/bench.py --update        record the results as the new baseline
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.atomic_io import write_json_atomic
+from src.generate_multiple_grids import MultipleGrids
+from src.generate_regular import Regular
+from src.parameters import iter_labware, read_grids
+from src.status_generator import StatusGenerator
+from src.status_store import read_status
+from src.verifier import Verifier
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+# scratch directory for the files the cases write, removed before and after every run
+WORK_DIR = Path(tempfile.gettempdir()) / "opentrons_labware_benchmarks"
+DEFAULT_THRESHOLD = 0.3
+DEFAULT_REPEAT = 9
+# how many more times a case that looks slower is measured before it counts as a regression
+DEFAULT_CONFIRM = 2
+# timer resolution and cache effects move cases under SHORT_CASE seconds by more than the
+# threshold between runs, so they may be up to SHORT_THRESHOLD slower
+SHORT_CASE = 1e-3
+SHORT_THRESHOLD = 1.0
+CALIBRATION_REPEAT = 3
+# sub-microsecond cases vary by more than any threshold between runs, so smaller slowdowns are
+# never counted as regressions
+MIN_SLOWDOWN = 1e-6
+# rows and columns of the standard plate sizes, from 6 to 6144 wells
+PLATE_SIZES = ((2, 3), (4, 6), (8, 12), (16, 24), (32, 48), (64, 96))
+VERIFIER_CHECKS = ("check_shapes", "check_heights", "check_well_positions", "check_metadata",
+                   "check_dimensions", "volume_violations")
+
+def plate_parameters(rows, cols):
+    """
+    Parameters of a flat-bottomed plate with rows x cols wells spread over the standard footprint.
+    """
+    x_spacing = round(108 / cols, 3)
+    y_spacing = round(72 / rows, 3)
+    diameter = round(0.7 * min(x_spacing, y_spacing), 3)
+    return {
+        "xDimension": 127, "yDimension": 85, "zDimension": 14,
+        "rows": rows, "cols": cols, "volume": round(0.5 * diameter ** 2 * 10, 2),
+        "well_shape": "circular", "bottom_shape": "flat", "well_depth": 10,
+        "well_diameter": diameter, "x_spacing": x_spacing, "y_spacing": y_spacing,
+        "x_offset": round((127 - (cols - 1) * x_spacing) / 2, 3),
+        "y_offset": round((85 - (rows - 1) * y_spacing) / 2, 3),
+        "display_name": f"Benchmark {rows * cols} Well Plate",
+        "load_name": f"benchmark_{rows * cols}_wellplate", "display_category": "wellPlate",
+    }
+
+def regular_plate(rows, cols):
+    plate = Regular()
+    plate.data = plate_parameters(rows, cols)
+    return plate
+
+def multiple_grids_plate(rows, cols):
+    """
+    The same plate split into two grids of half the rows each.
+    """
+    top = plate_parameters(rows, cols)
+    half = max(rows // 2, 1)
+    top["rows"] = half
+    bottom = dict(top, rows=rows - half)
+    top["y_offset"] = round(bottom["y_offset"] + (rows - half) * bottom["y_spacing"], 3)
+    plate = MultipleGrids()
+    plate.grids = [top, bottom]
+    return plate
+
+def definition(rows, cols):
+    plate = regular_plate(rows, cols)
+    plate.construct_labware()
+    return plate.template
+
+def cases(directory):
+    """
+    Yield (name, function) for every benchmark. Files are written to directory.
+    """
+    for rows, cols in PLATE_SIZES:
+        wells = rows * cols
+
+        def construct_regular(rows=rows, cols=cols):
+            regular_plate(rows, cols).construct_labware()
+        yield f"construct/regular/{wells}", construct_regular
+
+        def construct_multiple_grids(rows=rows, cols=cols):
+            multiple_grids_plate(rows, cols).construct_labware()
+        yield f"construct/multiple_grids/{wells}", construct_multiple_grids
+
+    for rows, cols in PLATE_SIZES:
+        wells = rows * cols
+        template = definition(rows, cols)
+        yield f"verify/load/{wells}", lambda template=template: Verifier(template).load()
+        verifier = Verifier(template)
+        verifier.load()
+        for check in VERIFIER_CHECKS:
+            yield f"verify/{check}/{wells}", getattr(verifier, check)
+        yield (f"verify/check_pipette[p300_single_gen2]/{wells}",
+               lambda verifier=verifier: verifier.check_pipette("p300_single_gen2"))
+
+    for rows, cols in ((8, 12), (64, 96)):
+        wells = rows * cols
+        labware_path = Path(directory) / f"plate_{wells}.json"
+        status_path = Path(directory) / f"status_{wells}.json"
+        write_json_atomic(labware_path, definition(rows, cols))
+
+        def status_cycle(labware_path=labware_path, status_path=status_path):
+            StatusGenerator(labware_path, status_path).generate_status_file()
+        status_cycle()
+        yield f"status/load_save/{wells}", status_cycle
+        yield f"status/read/{wells}", lambda status_path=status_path: read_status(status_path)
+
+    for name in ("96_wellplate_values", "filtration_values"):
+        path = DATA_DIR / f"{name}.csv"
+        yield f"csv/read_grids/{name}", lambda path=path: read_grids(path)
+
+    long_path = Path(directory) / "catalog.csv"
+    parameters = plate_parameters(8, 12)
+    with open(long_path, "w", encoding="utf-8") as file:
+        file.write(",".join(parameters) + "\n")
+        for i in range(1000):
+            row = dict(parameters, load_name=f"plate_{i}")
+            file.write(",".join(str(value) for value in row.values()) + "\n")
+    yield "csv/iter_labware/1000", lambda: sum(1 for _ in iter_labware(long_path))
+
+def measure(function, repeat=DEFAULT_REPEAT):
+    """
+    Median time per call in seconds, over repeat runs of enough calls to take about 0.2 s.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return statistics.median(timer.repeat(repeat, number)) / number
+
+def calibration():
+    """
+    Fixed pure Python workload whose time tracks how fast the machine currently runs.
+    """
+    sorted(str(i * 0.5) for i in range(1000))
+
+def measure_scaled(function, repeat, reference):
+    """
+    Time per call as measure() gives it, scaled to a machine that runs calibration() in
+    reference seconds.
+    """
+    seconds = measure(function, repeat)
+    return seconds * reference / measure(calibration, CALIBRATION_REPEAT)
+
+def is_regression(seconds, baseline, threshold):
+    if baseline < SHORT_CASE:
+        threshold = max(threshold, SHORT_THRESHOLD)
+    return seconds > baseline * (1 + threshold) and seconds - baseline > MIN_SLOWDOWN
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks and compare with a baseline.")
+    parser.add_argument("-k", "--keyword", default="",
+                        help="only run the cases whose name contains this text")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH,
+                        help="baseline JSON file to compare with or to update")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="allowed slowdown before a case counts as a regression, e.g. 0.3 "
+                             "for 30%% (default: the baseline's, or 0.3)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="timing repeats per case")
+    parser.add_argument("--confirm", type=int, default=DEFAULT_CONFIRM,
+                        help="times a case that looks slower is measured again; it only counts "
+                             "as a regression if every measurement is slower")
+    parser.add_argument("--update", action="store_true",
+                        help="write the results to the baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline.exists():
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    threshold = args.threshold
+    if threshold is None:
+        threshold = baseline.get("threshold", DEFAULT_THRESHOLD)
+    expected = baseline.get("results", {})
+    # a partial update has to stay comparable with the cases it does not run
+    reference = baseline.get("calibration") if not args.update or args.keyword else None
+    if reference is None:
+        reference = measure(calibration, CALIBRATION_REPEAT)
+
+    results = {}
+    regressions = []
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    WORK_DIR.mkdir(parents=True)
+    try:
+        for name, function in cases(WORK_DIR):
+            if args.keyword not in name:
+                continue
+            seconds = measure_scaled(function, args.repeat, reference)
+            for _ in range(args.confirm):
+                # measure again before reporting, to rule out a burst of load on the machine
+                if name not in expected or not is_regression(seconds, expected[name], threshold):
+                    break
+                seconds = min(seconds, measure_scaled(function, args.repeat, reference))
+            results[name] = seconds
+            line = f"{name:<52}{format_time(seconds):>10}"
+            if name in expected:
+                line += f"{seconds / expected[name]:>8.2f}x"
+                if is_regression(seconds, expected[name], threshold):
+                    regressions.append(name)
+                    line += "  REGRESSION"
+            print(line)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    if args.update:
+        results = dict(expected, **results) if args.keyword else results
+        write_json_atomic(args.baseline, {
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "threshold": threshold,
+            "calibration": round(reference, 9),
+            "results": {name: round(seconds, 9) for name, seconds in sorted(results.items())},
+        })
+        print(f"Baseline written to {args.baseline}.")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} of {len(results)} cases are more than {threshold:.0%} slower "
+              f"({max(threshold, SHORT_THRESHOLD):.0%} under {format_time(SHORT_CASE)}) than the "
+              f"baseline.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
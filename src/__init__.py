@@ -0,0 +1,38 @@
+"""
+Generators, verifier and well status tools for custom Opentrons labware.
+
+    from src import Regular, Verifier
+
+Nothing is imported until a name is first used, so importing the package is cheap and
+importing a name only loads the modules it needs. The command line tools run as modules from
+the repository root, e.g. python -m src.generate_catalog data.
+"""
+import importlib
+
+# public name -> module that defines it
+_EXPORTS = {
+    "Regular": "generate_regular",
+    "MultipleGrids": "generate_multiple_grids",
+    "Verifier": "verifier",
+    "StatusGenerator": "status_generator",
+    "WellAllocator": "status_generator",
+    "StatusStore": "status_store",
+    "read_status": "status_store",
+    "LabwareStore": "labware_store",
+    "load_labware": "labware_store",
+    "LabwareView": "labware_view",
+    "LabwareGeometry": "labware_geometry",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
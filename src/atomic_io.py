@@ -0,0 +1,56 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from . import serializer
+
+# the temporary file is created like open() does, so the process umask applies to it; mkstemp
+# would make it readable only by the owner
+_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+# Windows refuses to replace a file that another process has open, e.g. a status snapshot that
+# read_status is loading, so the replace is retried for up to about a second there
+_REPLACE_ATTEMPTS = 100 if os.name == "nt" else 1
+
+def _replace(source, target):
+    for attempt in range(_REPLACE_ATTEMPTS):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == _REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01)
+
+@contextmanager
+def atomic_write(path, mode="w", encoding="utf-8"):
+    """
+    Open a temporary file next to path and move it over path once the block succeeds,
+    so readers only ever see the old or the new file, never a partially written one.
+    :param path: the file to replace
+    :param mode: 'w' for text or 'wb' for bytes
+    """
+    path = Path(path)
+    while True:
+        tmp_path = path.parent / f".{path.name}.{os.urandom(4).hex()}.tmp"
+        try:
+            fd = os.open(tmp_path, _FLAGS, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with open(fd, mode, encoding=None if "b" in mode else encoding) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        _replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def write_json_atomic(path, data, style="pretty"):
+    """
+    Dump data as JSON to path atomically.
+    :param style: 'pretty', 'compact' or 'canonical', see serializer.py
+    """
+    with atomic_write(path) as file:
+        serializer.dump(data, file, style)
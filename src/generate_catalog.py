@@ -0,0 +1,173 @@
+"""
+Generate labware definitions for a whole catalog of parameter CSVs in parallel.
+
+Usage:
+    python -m src.generate_catalog data/96_wellplate_values.csv data/filtration_values.csv
+Inputs may also be directories or globs; every CSV in them must have its own load_name, since the
+definitions are named after it. Definitions go to build/labware unless -o is given, so the
+hand-maintained definitions in data/ are never overwritten by accident.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .atomic_io import write_json_atomic
+from .generate_multiple_grids import MultipleGrids
+from .generate_regular import Regular
+from .parameters import read_grids
+from .serializer import STYLES
+from .template_cache import DEFAULT_TEMPLATE_PATH
+
+GENERATORS = {"regular": Regular, "multiple_grids": MultipleGrids}
+MANIFEST_NAME = ".catalog_manifest.json"
+DEFAULT_OUTPUT_DIR = Path(__file__).parent.parent / "build" / "labware"
+# modules that decide what a generated definition looks like
+GENERATOR_MODULES = ("generate_catalog.py", "generate_regular.py", "generate_multiple_grids.py",
+                     "labels.py", "parameters.py", "serializer.py", "template_cache.py",
+                     "well_geometry.py")
+
+def find_files(inputs, pattern="*.csv"):
+    """
+    Expand directories, globs and file paths into a sorted list of paths.
+    :param pattern: the files to pick from directories; hidden files are skipped
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(path for path in Path(item).glob(pattern)
+                         if not path.name.startswith("."))
+        else:
+            matches = glob.glob(item)
+            if not matches:
+                raise ValueError(f"No files match {item}.")
+            paths.update(Path(match) for match in matches)
+    return sorted(path.resolve() for path in paths)
+
+def choose_generator(csv_path, generator="auto"):
+    """
+    Pick the generator for a CSV. 'auto' uses Regular for single-grid circular plates with flat
+    bottoms that are not tip racks, for which it writes the same definition as MultipleGrids
+    only faster, and MultipleGrids for everything else, since Regular ignores the bottom
+    shape and tip length.
+    :return: tuple of (generator name, load name)
+    """
+    grids = read_grids(csv_path)
+    grid = grids[0]
+    if generator == "auto":
+        if (len(grids) == 1 and grid.get("well_shape") == "circular"
+                and grid.get("bottom_shape", "flat") == "flat"
+                and grid.get("display_category") != "tipRack" and "tipLength" not in grid):
+            generator = "regular"
+        else:
+            generator = "multiple_grids"
+    return generator, grid["load_name"]
+
+def generator_version():
+    """
+    Hash of the generation code, so definitions are regenerated when a generator changes.
+    """
+    digest = hashlib.sha256()
+    for module in GENERATOR_MODULES:
+        digest.update((Path(__file__).parent / module).read_bytes())
+    return digest.hexdigest()
+
+def input_hash(csv_path, generator, style="pretty", version=""):
+    """
+    Hash of everything a generated definition depends on.
+    :param version: generator_version(), computed once per run by the caller
+    """
+    digest = hashlib.sha256(f"{generator}:{style}:{version}".encode())
+    digest.update(DEFAULT_TEMPLATE_PATH.read_bytes())
+    digest.update(Path(csv_path).read_bytes())
+    return digest.hexdigest()
+
+def generate_definition(csv_path, generator, output_path, style="pretty"):
+    """
+    Build one labware definition and write it atomically. Runs in a worker process.
+    """
+    plate = GENERATORS[generator]()
+    plate.read_parameters(csv_path)
+    plate.construct_labware()
+    write_json_atomic(output_path, plate.template, style)
+    return output_path
+
+def generate_catalog(inputs, output_dir=DEFAULT_OUTPUT_DIR, workers=None, force=False,
+                     generator="auto", style="pretty"):
+    """
+    Generate a definition named <load_name>.json in output_dir for every CSV in inputs.
+    Definitions whose CSV, template, generator and generation code are unchanged since the last
+    run are skipped.
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param force: regenerate every definition even if its inputs are unchanged
+    :param generator: 'regular', 'multiple_grids' or 'auto' to choose per CSV
+    :param style: JSON layout of the definitions, 'pretty', 'compact' or 'canonical'
+    :return: tuple of (generated output paths, skipped output paths)
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = {}
+    if manifest_path.exists() and not force:
+        with open(manifest_path, encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    version = generator_version()
+    jobs = []
+    skipped = []
+    outputs = {}
+    for csv_path in find_files(inputs):
+        csv_generator, load_name = choose_generator(csv_path, generator)
+        output_path = output_dir / f"{load_name}.json"
+        if output_path in outputs:
+            raise ValueError(f"{csv_path} and {outputs[output_path]} both define {load_name}.")
+        outputs[output_path] = csv_path
+
+        key = str(csv_path)
+        digest = input_hash(csv_path, csv_generator, style, version)
+        entry = manifest.get(key)
+        if (entry is not None and entry["hash"] == digest
+                and entry["output"] == output_path.name and output_path.exists()):
+            skipped.append(output_path)
+            continue
+        manifest[key] = {"hash": digest, "output": output_path.name}
+        jobs.append((csv_path, csv_generator, output_path, style))
+
+    if workers == 1 or len(jobs) <= 1:
+        generated = [generate_definition(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            generated = list(pool.map(generate_definition, *zip(*jobs)))
+
+    write_json_atomic(manifest_path, manifest)
+    return generated, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate labware definitions from parameter CSVs.")
+    parser.add_argument("inputs", nargs="+", help="parameter CSVs, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
+                        help="directory for the generated JSON definitions "
+                             "(default: build/labware)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-g", "--generator", choices=["auto", *GENERATORS], default="auto",
+                        help="generator to use; 'auto' picks Regular for single-grid circular "
+                             "flat-bottomed plates and MultipleGrids otherwise")
+    parser.add_argument("-s", "--style", choices=STYLES, default="pretty",
+                        help="JSON layout: 'pretty' matches the definitions in data/, 'compact' "
+                             "is smallest and fastest, 'canonical' also sorts keys")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="regenerate definitions even if their inputs are unchanged")
+    args = parser.parse_args(argv)
+
+    generated, skipped = generate_catalog(args.inputs, args.output_dir, args.workers, args.force,
+                                          args.generator, args.style)
+    for path in generated:
+        print(f"generated {path}")
+    print(f"{len(generated)} generated, {len(skipped)} unchanged")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
-import json
 from pathlib import Path
+from .labware_geometry import LabwareGeometry
+from .parameters import read_grids
+from .serializer import dump
+from .template_cache import load_template
+from .well_geometry import GridGeometry
 
 class MultipleGrids:
     """
@@ -9,6 +13,7 @@ class MultipleGrids:
     def __init__(self):
         self.template = {}
         self.grids = []
+        self.geometry = []
         self.read_template()
 
     def read_template(self, path: Path = None):
@@ -16,52 +21,70 @@ class MultipleGrids:
         Reads a JSON template file and saves it as a dictionary in self.template.
         :param path: the path to the JSON template file. Defaults to '../../data/default.json'.
         """
-        if path is None:
-            path = Path('../data/default.json')
-        with open(path, encoding="utf-8") as file:
-            self.template = json.load(file)
+        self.template = load_template(path)
 
     def read_parameters(self, path):
         """
         Reads a CSV file containing grid parameters and saves the information
         as a list of dictionaries in self.grids.
         """
-        with open(path, 'r') as file:
-            grid_data = []
+        self.grids = read_grids(path)
 
-            for line in file:
-                values = line.strip().split(',')
-                key = values[0].strip()
-
-                for i in range(1, len(values)):
-                    if len(grid_data) < i:
-                        grid_data.append({})
-                    value = values[i].strip()
-                    try:
-                        value = float(value)
-                        if value.is_integer():
-                            value = int(value)
-                    except ValueError:
-                        pass
-                    grid_data[i - 1][key] = value
-
-            self.grids = grid_data
-
-    def construct_labware(self):
+    def construct_labware(self, as_arrays=False):
         """
         Call functions to construct each part of the dictionary, create wells, and order them.
+        :param as_arrays: only compute well coordinates into self.geometry, without well dicts
         """
         self.create_plate()
         self.display_name()
         self.load_name()
         self.display_category()
         self.well_bottom_shape()
+        self.geometry = []
         current_row_index = 0
         for grid in self.grids:
-            current_row_index = self.create_wells(grid, current_row_index)
+            current_row_index = self.create_wells(grid, current_row_index, as_arrays)
+        # ordering and groups come from self.geometry, so the array path gets them as well
         self.ordering()
         self.wells()
 
+    def update_grid(self, index: int, **parameters):
+        """
+        Changes parameters of one grid after construct_labware and only recomputes what depends
+        on them. Changing rows or cols renames the wells of every later grid, so that rebuilds
+        all wells and the ordering; any other change only recomputes the wells of this grid.
+        :param index: position of the grid in self.grids
+        :param parameters: new values, e.g. x_offset=20 or well_diameter=7.5
+        :return: names of the wells that were recomputed, e.g. to pass to Verifier.verify_wells
+        """
+        grid = self.grids[index]
+        grid.update(parameters)
+
+        if index == 0:
+            self.create_plate()
+            self.display_name()
+            self.load_name()
+            self.display_category()
+            self.well_bottom_shape()
+        elif "zDimension" in parameters:
+            self.update_dimension("z")
+
+        if "rows" in parameters or "cols" in parameters:
+            self.template["wells"] = {}
+            self.geometry = []
+            current_row_index = 0
+            for other in self.grids:
+                current_row_index = self.create_wells(other, current_row_index)
+            self.ordering()
+            self.wells()
+            return list(self.template["wells"])
+
+        # well names are unchanged, so overwriting them keeps their position in the template
+        start_row_index = sum(geometry.rows for geometry in self.geometry[:index])
+        self.create_wells(grid, start_row_index)
+        self.geometry[index] = self.geometry.pop()
+        return self.geometry[index].names()
+
     def update_dimension(self, direction: str, new_value: float = None):
         """
         Helper function for create_plate. Updates the dimensions of the plate.
@@ -123,91 +146,94 @@ class MultipleGrids:
             shape = self.grids[0]["bottom_shape"]
         self.template["groups"][0]["metadata"]["wellBottomShape"] = shape
 
-    def create_wells(self, grid, start_row_index):
+    def create_wells(self, grid, start_row_index, as_arrays=False):
         """
         Creates wells based on the given parameters
         start_row_index: keeps track of the indexes of letters for row names
+        as_arrays: only append the grid's coordinates to self.geometry and skip the well dicts
         """
         if "wells" not in self.template:
             self.template["wells"] = {}
 
-        def get_label(index):
-            """
-            Convert a numerical index to the corresponding label A,...,Z,AA,...ZZ,AAA...
-            """
-            label = ''
-            while index >= 0:
-                label = chr(ord('A') + index % 26) + label
-                index = index // 26 - 1
-            return label
-
-        for row in range(grid['rows']):
-            row_letter = get_label(start_row_index + row)
-            for col in range(1, grid['cols'] + 1):
-                well_name = f"{row_letter}{col}"
-                x = round(grid['x_offset'] + (col - 1) * grid['x_spacing'], 2)
-                y = round(grid['y_offset'] + (grid['rows'] - row - 1) * grid['y_spacing'], 2)
-                # y = round(grid['y_offset'] + row * grid['y_spacing'], 2)
-                z = round(grid['zDimension'] - grid['well_depth'], 2)
-
-                if grid['well_shape'] == "circular":
-                    well = {
-                        "depth": grid['well_depth'],
-                        "totalLiquidVolume": grid['volume'],
-                        "shape": grid['well_shape'],
-                        "diameter": grid['well_diameter'],
-                        "x": x,
-                        "y": y,
-                        "z": z
-                    }
-                else:  # well_shape is 'rectangular'
-                    well = {
-                        "depth": grid['well_depth'],
-                        "totalLiquidVolume": grid['volume'],
-                        "shape": grid['well_shape'],
-                        "xDimension": grid['well_xDimension'],
-                        "yDimension": grid['well_yDimension'],
-                        "x": x,
-                        "y": y,
-                        "z": z
-                    }
-
-                self.template["wells"][well_name] = well
+        geometry = GridGeometry(grid['rows'], grid['cols'], grid['x_offset'], grid['y_offset'],
+                                grid['x_spacing'], grid['y_spacing'], grid['zDimension'],
+                                grid['well_depth'], start_row_index)
+        self.geometry.append(geometry)
+
+        if not as_arrays:
+            self.template["wells"].update(geometry.to_wells(self.well_fields(grid)))
 
         return start_row_index + grid['rows']
 
+    def well_fields(self, grid):
+        """
+        The fields shared by every well of a grid: depth, volume, shape and size.
+        """
+        if grid['well_shape'] == "circular":
+            return {
+                "depth": grid['well_depth'],
+                "totalLiquidVolume": grid['volume'],
+                "shape": grid['well_shape'],
+                "diameter": grid['well_diameter']
+            }
+        # well_shape is 'rectangular'
+        return {
+            "depth": grid['well_depth'],
+            "totalLiquidVolume": grid['volume'],
+            "shape": grid['well_shape'],
+            "xDimension": grid['well_xDimension'],
+            "yDimension": grid['well_yDimension']
+        }
+
+    def to_labware_geometry(self):
+        """
+        Builds the array-backed LabwareGeometry of the plate straight from the grid coordinates,
+        without well dicts. Call after construct_labware, with or without as_arrays.
+        """
+        labware = LabwareGeometry(self.template)
+        for grid, geometry in zip(self.grids, self.geometry):
+            labware.add_grid(geometry, self.well_fields(grid))
+        return labware
+
     def ordering(self):
         """
-        Generates the ordering list for the wells, sorted by column first and then by row
+        Generates the ordering list for the wells, sorted by column first and then by row.
+        Built from the row labels and column count of each grid in self.geometry, whose rows
+        are already in order, so no well names are parsed or sorted.
         """
         ordering = []
-        for well_name in sorted(self.template["wells"].keys(), key=lambda x: (int(x[1:]), x[0])):
-            col = int(well_name[1:])
-            if len(ordering) < col:
-                ordering.append([])
-            ordering[col - 1].append(well_name)
+        for geometry in self.geometry:
+            for col in range(1, geometry.cols + 1):
+                if len(ordering) < col:
+                    ordering.append([])
+                ordering[col - 1].extend(f"{label}{col}" for label in geometry.row_labels)
 
         self.template["ordering"] = ordering
 
     def wells(self):
         """
-        Generates the list of well names, sorted by column first and then by row
+        Generates the list of well names from the ordering, sorted by column first and then by row
         """
-        wells = sorted(self.template["wells"].keys(), key=lambda x: (int(x[1:]), x[0]))
-        self.template["groups"][0]["wells"].extend(wells)
+        wells = [well_name for column in self.template["ordering"] for well_name in column]
+        self.template["groups"][0]["wells"] = wells
+
+def main():
+    data_dir = Path(__file__).parent.parent / "data"
+    plate = MultipleGrids()
+    plate.read_parameters(data_dir / "filtration_values.csv")
+    # plate.read_parameters(data_dir / "irregular_tuberack_values.csv")
+    # plate.read_parameters(data_dir / "rectangular_well_values.csv")
+    plate.construct_labware()
 
-plate = MultipleGrids()
-plate.read_parameters(Path('../data/filtration_values.csv'))
-# plate.read_parameters(Path('../data/irregular_tuberack_values.csv'))
-# plate.read_parameters(Path('../data/rectangular_well_values.csv'))
-plate.construct_labware()
-print(json.dumps(plate.template, indent=4))
+    with open(data_dir / "filtration.json", "w") as f:
+        dump(plate.template, f)
+    print(f"Wrote {len(plate.template['wells'])} wells to {data_dir / 'filtration.json'}")
 
-with open(Path(r"../data/filtration.json"), "w") as f:
-    json.dump(plate.template, f, indent=4)
+    plate = MultipleGrids()
+    plate.read_parameters(data_dir / "stirrer_values_20ml.csv")
+    plate.construct_labware()
+    with open(data_dir / "stirrer_20ml.json", "w") as f:
+        dump(plate.template, f)
 
-plate = MultipleGrids()
-plate.read_parameters(Path('../data/stirrer_values_20ml.csv'))
-plate.construct_labware()
-with open(Path(r"../data/stirrer_20ml.json"), "w") as f:
-    json.dump(plate.template, f, indent=4)
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
-import json
+import sys
 from pathlib import Path
 from typing import Union, List
+from .labels import get_labels
+from .labware_geometry import LabwareGeometry
+from .parameters import read_grids
+from .serializer import dump
+from .template_cache import load_template
+from .well_geometry import GridGeometry
 
 class Regular:
     """
@@ -9,6 +15,8 @@ class Regular:
     def __init__(self):
         self.template = {}
         self.data = {}
+        self.geometry = None
+        self.well_fields = None
         # self._display_name = None
         self.read_template()
 
@@ -17,40 +25,24 @@ class Regular:
         Reads a JSON template file and saves it as a dictionary in self.template.
         :param path: the path to the JSON template file. Defaults to '../../data/default.json'.
         """
-        if path is None:
-            path = Path(__file__).parent.parent / 'data' / 'default.json'
-        with open(path, encoding="utf-8") as file:
-            self.template = json.load(file)
+        self.template = load_template(path)
 
     def read_parameters(self, path):
         """
         :param path: path to csv file with inputs, saves information as data dictionary
         """
-        data = {}
-        with open(path, 'r') as file:
-            for line in file:
-                pair = line.strip().split(',')
-                key = pair[0].strip()
-                value = pair[1].strip()
-                # convert value to float if possible, otherwise to int if possible
-                try:
-                    value = float(value)
-                    if value.is_integer():
-                        value = int(value)
-                except ValueError:
-                    pass  # keep value as string if it cannot be converted to float or int
-                data[key] = value
-        self.data = data
-
-    def construct_labware(self):
+        self.data = read_grids(path)[0]
+
+    def construct_labware(self, as_arrays=False):
         """
         call functions to construct each part of the dictionary
+        :param as_arrays: only compute well coordinates into self.geometry, without well dicts
         """
         self.create_plate()
         self.display_name()
         self.load_name()
         self.display_category()
-        self.create_wells()
+        self.create_wells(as_arrays=as_arrays)
         self.ordering()
         self.wells()
 
@@ -104,9 +96,11 @@ class Regular:
 
     def create_wells(self, rows=None, cols=None, well_depth=None, volume=None, well_shape=None,
                      well_diameter=None, x_offset=None,
-                     y_offset=None, x_spacing=None, y_spacing=None, zDimension=None):
+                     y_offset=None, x_spacing=None, y_spacing=None, zDimension=None,
+                     as_arrays=False):
         """
         Creates wells based on the given parameters.
+        :param as_arrays: only store the coordinates in self.geometry and skip the well dicts
         """
         params = {
             'rows': rows, 'cols': cols, 'well_depth': well_depth, 'volume': volume,
@@ -120,90 +114,69 @@ class Regular:
             if value is None:
                 params[key] = self.data[key]
 
-        def get_label(index):
-            """
-            Convert a numerical index to the corresponding label A,...,Z,AA,...ZZ,AAA...
-            """
-            label = ''
-            while index >= 0:
-                label = chr(ord('A') + index % 26) + label
-                index = index // 26 - 1
-            return label
-
-        for col in range(1, params['cols'] + 1):
-            for row in range(params['rows']):
-                letter = get_label(row)
-                well_name = f"{letter}{col}"
-                x = round(params['x_offset'] + (col - 1) * params['x_spacing'], 2)
-                y = round(params['y_offset'] + (params['rows'] - row - 1) * params['y_spacing'], 2)
-                z = round(params['zDimension'] - params['well_depth'], 2)
-                self.create_well(well_name, params['well_depth'], params['volume'],
-                                 params['well_shape'], params['well_diameter'], x, y, z)
-
-    def create_well(self, well_name, well_depth, volume, well_shape, well_diameter, x, y, z):
-        """
-        Creates a single well with the specified parameters.
-        """
-        well = {
-            "depth": well_depth,
-            "totalLiquidVolume": volume,
-            "shape": well_shape,
-            "diameter": well_diameter,
-            "x": x,
-            "y": y,
-            "z": z
+        self.geometry = GridGeometry(params['rows'], params['cols'], params['x_offset'],
+                                     params['y_offset'], params['x_spacing'],
+                                     params['y_spacing'], params['zDimension'],
+                                     params['well_depth'])
+        self.well_fields = {
+            "depth": params['well_depth'],
+            "totalLiquidVolume": params['volume'],
+            "shape": params['well_shape'],
+            "diameter": params['well_diameter']
         }
-        self.template["wells"][well_name] = well
+        if as_arrays:
+            return
+
+        self.template["wells"].update(self.geometry.to_wells(self.well_fields, column_major=True))
+
+    def to_labware_geometry(self):
+        """
+        Builds the array-backed LabwareGeometry of the plate straight from the grid coordinates,
+        without well dicts. Call after construct_labware, with or without as_arrays.
+        """
+        geometry = LabwareGeometry(self.template)
+        geometry.add_grid(self.geometry, self.well_fields, column_major=True)
+        return geometry
 
     def ordering(self, rows: Union[int, List[str]] = None, cols: Union[int, List[int]] = None):
         """
         generates the ordering list based on number of rows and cols
         """
-        ordering = []
-        if rows is None and cols is None:
-            for i in range(1, self.data["cols"] + 1):
-                row = []
-                for j in range(0, self.data["rows"]):
-                    letter = chr(ord('A') + j)
-                    row.append(f"{letter}{i}")
-                ordering.append(row)
-        else:
-            if isinstance(cols, int):
-                cols = range(1, cols + 1)
-            if isinstance(rows, int):
-                rows = [chr(ord('A') + j) for j in range(rows)]
-            for i in cols:
-                row = []
-                for letter in rows:
-                    row.append(f"{letter}{i}")
-                ordering.append(row)
-        self.template["ordering"] = ordering
+        self.template["ordering"] = self.column_names(rows, cols)
 
     def wells(self, rows: Union[int, List[str]] = None, cols: Union[int, List[int]] = None):
         """
         generates the list of wells based on number of rows and cols
         """
-        wells = []
+        self.template["groups"][0]["wells"] = [
+            well_name for column in self.column_names(rows, cols) for well_name in column]
+
+    def column_names(self, rows: Union[int, List[str]] = None,
+                     cols: Union[int, List[int]] = None):
+        """
+        well names grouped by column, each column ordered by row
+        :param rows: number of rows or list of row labels, defaults to self.data["rows"]
+        :param cols: number of columns or list of column numbers, defaults to self.data["cols"]
+        """
         if rows is None and cols is None:
-            for i in range(1, self.data["cols"] + 1):
-                for j in range(0, self.data["rows"]):
-                    letter = chr(ord('A') + j)
-                    wells.append(f"{letter}{i}")
-        else:
-            if isinstance(cols, int):
-                cols = range(1, cols + 1)
-            if isinstance(rows, int):
-                rows = [chr(ord('A') + j) for j in range(rows)]
-            for i in cols:
-                for letter in rows:
-                    wells.append(f"{letter}{i}")
-        self.template["groups"][0]["wells"] = wells
-
-plate = Regular()
-plate.read_parameters(Path('../data/24_wellplate_values.csv'))
-# plate.read_parameters(Path('../../data/96_wellplate_values.csv'))
-plate.construct_labware()
-print(json.dumps(plate.template, indent=4))
-
-# with open(Path(r"../../data/result.json"), "w") as f:
-#     json.dump(dict1, f)
+            rows, cols = self.data["rows"], self.data["cols"]
+        if isinstance(cols, int):
+            cols = range(1, cols + 1)
+        if isinstance(rows, int):
+            rows = get_labels(0, rows)
+        return [[f"{letter}{i}" for letter in rows] for i in cols]
+
+def main():
+    data_dir = Path(__file__).parent.parent / "data"
+    plate = Regular()
+    plate.read_parameters(data_dir / "24_wellplate_values.csv")
+    # plate.read_parameters(data_dir / "96_wellplate_values.csv")
+    plate.construct_labware()
+    dump(plate.template, sys.stdout)
+    print()
+
+    # with open(data_dir / "result.json", "w") as f:
+    #     dump(plate.template, f)
+
+if __name__ == "__main__":
+    main()
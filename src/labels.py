@@ -0,0 +1,83 @@
+import re
+import threading
+
+# row labels A,...,Z,AA,...,ZZ,AAA,... by index, and the reverse mapping; grown on demand
+_labels = []
+_indices = {}
+_lock = threading.Lock()
+
+_WELL_NAME = re.compile(r"([A-Z]+)([0-9]+)")
+_well_names = {}
+
+def _extend(count):
+    """
+    Grow the label table so that it holds at least count labels.
+    """
+    with _lock:
+        index = len(_labels)
+        if index >= count:
+            return
+        # double the table so repeated lookups of growing indices stay amortized O(1)
+        count = max(count, 2 * index, 26)
+        while index < count:
+            label = ''
+            remainder = index
+            while remainder >= 0:
+                label = chr(ord('A') + remainder % 26) + label
+                remainder = remainder // 26 - 1
+            _indices[label] = index
+            _labels.append(label)
+            index += 1
+
+def get_label(index):
+    """
+    Convert a numerical index to the corresponding label A,...,Z,AA,...ZZ,AAA...
+    """
+    if index < 0:
+        raise ValueError(f"Row index must not be negative, got {index}.")
+    if index >= len(_labels):
+        _extend(index + 1)
+    return _labels[index]
+
+def get_labels(start, count):
+    """
+    Labels for the count rows starting at index start.
+    """
+    if start < 0:
+        raise ValueError(f"Row index must not be negative, got {start}.")
+    if start + count > len(_labels):
+        _extend(start + count)
+    return _labels[start:start + count]
+
+def label_index(label):
+    """
+    Convert a row label back to its numerical index, e.g. 'A' -> 0 and 'AA' -> 26.
+    """
+    index = _indices.get(label)
+    if index is not None:
+        return index
+    if not label or not label.isalpha() or not label.isupper() or not label.isascii():
+        raise ValueError(f"Invalid row label '{label}'.")
+    index = 0
+    for letter in label:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def parse_well_name(name):
+    """
+    Split a well name into its row index and column number, e.g. 'B3' -> (1, 3).
+    """
+    parsed = _well_names.get(name)
+    if parsed is None:
+        match = _WELL_NAME.fullmatch(name)
+        if match is None:
+            raise ValueError(f"Invalid well name '{name}'.")
+        parsed = (label_index(match.group(1)), int(match.group(2)))
+        _well_names[name] = parsed
+    return parsed
+
+def well_name(row_index, col):
+    """
+    Build a well name from a row index and a column number, e.g. (1, 3) -> 'B3'.
+    """
+    return f"{get_label(row_index)}{col}"
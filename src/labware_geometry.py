@@ -0,0 +1,313 @@
+import math
+import operator
+from array import array
+
+CIRCULAR = 0
+RECTANGULAR = 1
+UNKNOWN_SHAPE = -1
+SHAPES = {"circular": CIRCULAR, "rectangular": RECTANGULAR}
+SHAPE_NAMES = {code: shape for shape, code in SHAPES.items()}
+
+# numeric well fields, in the order Opentrons writes them around "shape"
+COLUMNS = ("depth", "totalLiquidVolume", "diameter", "xDimension", "yDimension", "x", "y", "z")
+_BEFORE_SHAPE = ("depth", "totalLiquidVolume")
+_AFTER_SHAPE = ("diameter", "xDimension", "yDimension", "x", "y", "z")
+_SHARED = ("depth", "totalLiquidVolume", "diameter", "xDimension", "yDimension")
+_KNOWN_KEYS = frozenset(COLUMNS) | {"shape"}
+_MISSING = math.nan
+# fields every well needs, and the ones that give the footprint of each shape
+REQUIRED_FIELDS = ("depth", "totalLiquidVolume", "x", "y", "z")
+SHAPE_FIELDS = {CIRCULAR: ("diameter",), RECTANGULAR: ("xDimension", "yDimension")}
+
+class LabwareGeometry:
+    """
+    Column-oriented form of a labware definition. The wells are stored as one typed array per
+    field instead of one dict per well, which takes a fraction of the memory for large plates
+    and lets checks run over whole columns. Everything except the wells is kept as a dict.
+    Converts losslessly to and from the Opentrons JSON dictionary: whole numbers are flagged so
+    they come back as ints, and unknown well fields are kept in self.extras.
+    """
+    __slots__ = ("definition", "names", "index", "shape", "columns", "integers", "extras",
+                 "_buckets")
+
+    def __init__(self, definition=None):
+        """
+        :param definition: the labware definition; its "wells" entry is only kept as a placeholder
+        """
+        self.definition = {"wells": None} if definition is None else dict(definition, wells=None)
+        self.names = []
+        self.index = {}
+        self.shape = array('b')
+        self.columns = {key: array('d') for key in COLUMNS}
+        self.integers = {key: array('B') for key in COLUMNS}
+        self.extras = {}
+        self._buckets = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    @classmethod
+    def from_definition(cls, definition):
+        """
+        Build the column form of an Opentrons labware definition dictionary.
+        """
+        geometry = cls(definition)
+        for name, well in definition.get("wells", {}).items():
+            geometry.add_well(name, well)
+        return geometry
+
+    def to_definition(self):
+        """
+        Rebuild the Opentrons labware definition dictionary.
+        """
+        return dict(self.definition, wells=self.wells())
+
+    def add_well(self, name, well):
+        """
+        Append one well given as an Opentrons well dictionary.
+        """
+        self._buckets = None
+        self.index[name] = len(self.names)
+        self.names.append(name)
+        shape = well.get("shape")
+        self.shape.append(SHAPES.get(shape, UNKNOWN_SHAPE))
+        for key in COLUMNS:
+            value = well.get(key, _MISSING)
+            self.columns[key].append(value)
+            self.integers[key].append(type(value) is int)
+        extra = {key: value for key, value in well.items() if key not in _KNOWN_KEYS}
+        if "shape" in well and shape not in SHAPES:
+            extra["shape"] = shape
+        if extra:
+            self.extras[name] = extra
+
+    def add_grid(self, grid, well, column_major=False):
+        """
+        Append every well of a GridGeometry without building per-well dicts.
+        :param well: the fields shared by every well of the grid (depth, volume, shape and size)
+        """
+        self._buckets = None
+        names, xs, ys = grid.cells(column_major)
+        count = len(names)
+        start = len(self.names)
+        self.names.extend(names)
+        self.index.update(zip(names, range(start, start + count)))
+        self.shape.extend(array('b', [SHAPES.get(well["shape"], UNKNOWN_SHAPE)]) * count)
+        for key, values in (("x", xs), ("y", ys), ("z", [grid.z] * count)):
+            self.columns[key].extend(values)
+            self.integers[key].extend([type(value) is int for value in values])
+        for key in _SHARED:
+            value = well.get(key, _MISSING)
+            self.columns[key].extend(array('d', [value]) * count)
+            self.integers[key].extend(array('B', [type(value) is int]) * count)
+
+    def update_well(self, name, well):
+        """
+        Overwrite an existing well with an Opentrons well dictionary, keeping its position in
+        the well order, e.g. after MultipleGrids.update_grid moved it. The cell index of
+        cell_index() is patched instead of rebuilt, unless the well outgrew its cells.
+        """
+        i = self.index[name]
+        if self._buckets is not None and self._buckets[0] > 0:
+            self._buckets[3][self._cell(i, self._buckets[0])].remove(i)
+        shape = well.get("shape")
+        self.shape[i] = SHAPES.get(shape, UNKNOWN_SHAPE)
+        for key in COLUMNS:
+            value = well.get(key, _MISSING)
+            self.columns[key][i] = value
+            self.integers[key][i] = type(value) is int
+        extra = {key: value for key, value in well.items() if key not in _KNOWN_KEYS}
+        if "shape" in well and shape not in SHAPES:
+            extra["shape"] = shape
+        if extra:
+            self.extras[name] = extra
+        else:
+            self.extras.pop(name, None)
+        if self._buckets is None:
+            return
+
+        cell_size, half_x, half_y, buckets = self._buckets
+        if self.shape[i] == RECTANGULAR:
+            half = (self.columns["xDimension"][i] / 2.0, self.columns["yDimension"][i] / 2.0)
+        else:
+            half = (self.columns["diameter"][i] / 2.0,) * 2
+        x, y = self.columns["x"][i], self.columns["y"][i]
+        # NaN fails every comparison, so wells missing a field also rebuild the index
+        if cell_size > 0 and 2 * max(half) <= cell_size and x == x and y == y:
+            half_x[i], half_y[i] = half
+            buckets.setdefault(self._cell(i, cell_size), []).append(i)
+        else:
+            self._buckets = None
+
+    def missing_fields(self, well_names=None):
+        """
+        Required fields that are not set, as (well name, field) pairs in well order. Missing
+        fields are stored as NaN, which every comparison of the checks would let through.
+        Wells of an unknown shape are only checked for REQUIRED_FIELDS.
+        :param well_names: only look at these wells. Defaults to all wells.
+        """
+        if well_names is None:
+            rows = range(len(self.names))
+        else:
+            rows = sorted({self.index[name] for name in well_names})
+        missing = []
+        for key in REQUIRED_FIELDS + ("diameter", "xDimension", "yDimension"):
+            column = self.columns[key]
+            if well_names is None and all(value == value for value in column):
+                continue
+            for i in rows:
+                value = column[i]
+                if value != value and (key in REQUIRED_FIELDS
+                                       or key in SHAPE_FIELDS.get(self.shape[i], ())):
+                    missing.append((i, key))
+        missing.sort()
+        return [(self.names[i], key) for i, key in missing]
+
+    def value(self, key, i):
+        """
+        Value of a numeric field of the i-th well, as an int if it was given as one.
+        """
+        value = self.columns[key][i]
+        if value != value:  # NaN: the field is not set for this well
+            return None
+        return int(value) if self.integers[key][i] else value
+
+    def well(self, name):
+        """
+        Rebuild the Opentrons dictionary of a single well.
+        """
+        i = self.index[name]
+        well = {}
+        for key in _BEFORE_SHAPE:
+            value = self.value(key, i)
+            if value is not None:
+                well[key] = value
+        shape = SHAPE_NAMES.get(self.shape[i])
+        if shape is not None:
+            well["shape"] = shape
+        for key in _AFTER_SHAPE:
+            value = self.value(key, i)
+            if value is not None:
+                well[key] = value
+        well.update(self.extras.get(name, ()))
+        return well
+
+    def wells(self):
+        """
+        Rebuild the "wells" dictionary of the definition.
+        """
+        return {name: self.well(name) for name in self.names}
+
+    def half_extents(self):
+        """
+        Half-width and half-height of every well's footprint, as two arrays.
+        """
+        half_x = array('d', self.columns["diameter"])
+        half_y = array('d', self.columns["diameter"])
+        x_dimension = self.columns["xDimension"]
+        y_dimension = self.columns["yDimension"]
+        for i, shape in enumerate(self.shape):
+            if shape == RECTANGULAR:
+                half_x[i] = x_dimension[i]
+                half_y[i] = y_dimension[i]
+        return (array('d', [value / 2.0 for value in half_x]),
+                array('d', [value / 2.0 for value in half_y]))
+
+    def bottom_shapes(self):
+        """
+        Bottom shape ('flat', 'v' or 'u') of every well, from the groups of the definition.
+        """
+        shapes = ["flat"] * len(self.names)
+        for group in self.definition.get("groups", ()):
+            shape = group.get("metadata", {}).get("wellBottomShape", "flat")
+            for name in group.get("wells", ()):
+                i = self.index.get(name)
+                if i is not None:
+                    shapes[i] = shape
+        return shapes
+
+    def physical_volumes(self, bottom_correction=False):
+        """
+        Maximum volume every well can physically hold, in µL (mm^3), as an array.
+        Circular wells use their diameter and rectangular wells their x and y dimensions.
+        :param bottom_correction: subtract the volume lost to v and u shaped bottoms. A v bottom
+            is taken as a cone (or pyramid) as tall as the well's half width, and a u bottom as a
+            hemisphere (or half cylinder along the long side) of that radius. Otherwise all wells
+            are treated as flat bottomed.
+        """
+        depths = self.columns["depth"]
+        diameters = self.columns["diameter"]
+        x_dimensions = self.columns["xDimension"]
+        y_dimensions = self.columns["yDimension"]
+        rectangular = [shape == RECTANGULAR for shape in self.shape]
+
+        areas = [x * y if rect else math.pi * d * d / 4.0
+                 for rect, d, x, y in zip(rectangular, diameters, x_dimensions, y_dimensions)]
+        volumes = array('d', map(operator.mul, areas, depths))
+        if not bottom_correction:
+            return volumes
+
+        for i, bottom in enumerate(self.bottom_shapes()):
+            if bottom == "flat":
+                continue
+            if rectangular[i]:
+                short, long = sorted((x_dimensions[i], y_dimensions[i]))
+                radius = short / 2.0
+                if bottom == "v":
+                    volumes[i] -= 2.0 / 3.0 * areas[i] * radius
+                else:
+                    volumes[i] -= (2.0 - math.pi / 2.0) * radius * radius * long
+            else:
+                radius = diameters[i] / 2.0
+                if bottom == "v":
+                    volumes[i] -= 2.0 / 3.0 * areas[i] * radius
+                else:
+                    volumes[i] -= math.pi * radius ** 3 / 3.0
+        return volumes
+
+    def find_well(self, x, y):
+        """
+        Index of the well whose footprint contains the point (x, y), or None.
+        """
+        cell_size, half_x, half_y, buckets = self.cell_index()
+        if not buckets:
+            return None
+        xs = self.columns["x"]
+        ys = self.columns["y"]
+        cell_x, cell_y = math.floor(x / cell_size), math.floor(y / cell_size)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in buckets.get((cell_x + dx, cell_y + dy), ()):
+                    offset_x = abs(x - xs[i])
+                    offset_y = abs(y - ys[i])
+                    if self.shape[i] == RECTANGULAR:
+                        if offset_x <= half_x[i] and offset_y <= half_y[i]:
+                            return i
+                    elif math.hypot(offset_x, offset_y) <= half_x[i]:
+                        return i
+        return None
+
+    def cell_index(self):
+        """
+        Grid of cells at least as wide as the largest well, so the wells near a point are found
+        by only looking at its own and the eight neighbouring cells. Built on first use and kept
+        until wells are added.
+        :return: cell size, the half extents of every well, and the indices of the wells in
+            each (cell x, cell y) cell
+        """
+        if self._buckets is None:
+            half_x, half_y = self.half_extents()
+            cell_size = 2 * max(max(half_x, default=0), max(half_y, default=0))
+            buckets = {}
+            if cell_size > 0:
+                for i in range(len(self.names)):
+                    buckets.setdefault(self._cell(i, cell_size), []).append(i)
+            self._buckets = (cell_size, half_x, half_y, buckets)
+        return self._buckets
+
+    def _cell(self, i, cell_size):
+        return (math.floor(self.columns["x"][i] / cell_size),
+                math.floor(self.columns["y"][i] / cell_size))
@@ -0,0 +1,189 @@
+"""
+Local store of parsed labware definitions, addressed by content hash and looked up by loadName.
+
+Protocols load the same few definitions on every run. The store keeps each one as a pickle, so
+it is read back without parsing JSON, and remembers which hash every JSON file had at a given
+modification time and size, so an unchanged file is resolved with a single stat.
+
+Layout of the store directory:
+    index.json              loadName -> hash, and source file -> [mtime_ns, size, hash]
+    objects/<hash>.pickle   (STORE_VERSION, definition)
+
+Usage: python -m src.labware_store data
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+from .atomic_io import atomic_write, write_json_atomic
+from . import serializer
+
+# bump when the pickled layout changes; objects and indexes of other versions are ignored
+STORE_VERSION = 1
+DEFAULT_STORE_PATH = Path(__file__).parent.parent / "data" / ".labware_store"
+
+def definition_hash(definition):
+    """
+    SHA-256 of the canonical JSON of a definition, so it does not depend on how the file
+    was formatted.
+    """
+    return hashlib.sha256(serializer.dumps(definition, "canonical").encode()).hexdigest()
+
+class LabwareStore:
+    def __init__(self, root=DEFAULT_STORE_PATH):
+        """
+        :param root: directory of the store, created on the first add
+        """
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self._index = None
+        # hash -> pickled definition, so each object is read from disk once per process
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def _read_index(self):
+        if self.index_path.exists():
+            with open(self.index_path, encoding="utf-8") as file:
+                index = json.load(file)
+            if index.get("version") == STORE_VERSION:
+                return index
+        return {"version": STORE_VERSION, "load_names": {}, "sources": {}}
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    def _object_path(self, digest):
+        return self.root / "objects" / f"{digest}.pickle"
+
+    def _read_object(self, digest):
+        """
+        Pickled definition of a hash, or None if it is not stored or was stored by another version.
+        """
+        data = self._objects.get(digest)
+        if data is None:
+            try:
+                with open(self._object_path(digest), "rb") as file:
+                    version, data = pickle.load(file)
+            except FileNotFoundError:
+                return None
+            if version != STORE_VERSION:
+                return None
+            self._objects[digest] = data
+        return data
+
+    def add(self, definition, source=None):
+        """
+        Store a definition under its content hash and, if it has one, its loadName.
+        :param source: the JSON file the definition was read from, so resolve() can skip it
+        :return: the content hash
+        """
+        digest = definition_hash(definition)
+        data = pickle.dumps(definition, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            object_path = self._object_path(digest)
+            if self._read_object(digest) is None:
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                with atomic_write(object_path, "wb") as file:
+                    pickle.dump((STORE_VERSION, data), file, pickle.HIGHEST_PROTOCOL)
+                self._objects[digest] = data
+            load_name = definition.get("parameters", {}).get("loadName")
+            if load_name:
+                self.index["load_names"][load_name] = digest
+            if source is not None:
+                stat = os.stat(source)
+                self.index["sources"][os.path.abspath(source)] = [stat.st_mtime_ns, stat.st_size,
+                                                                  digest]
+            write_json_atomic(self.index_path, self.index, "compact")
+        return digest
+
+    def add_file(self, path):
+        """
+        Parse a JSON definition and store it.
+        :return: the content hash
+        """
+        with open(path, encoding="utf-8") as file:
+            definition = json.load(file)
+        return self.add(definition, path)
+
+    def get(self, key):
+        """
+        Returns a fresh copy of a stored definition.
+        :param key: a loadName or a content hash
+        """
+        digest = self.index["load_names"].get(key, key)
+        data = self._read_object(digest)
+        if data is None:
+            # another process may have added it since the index was read
+            self._index = self._read_index()
+            digest = self.index["load_names"].get(key, key)
+            data = self._read_object(digest)
+            if data is None:
+                raise ValueError(f"No labware '{key}' in the store at {self.root}.")
+        return pickle.loads(data)
+
+    def resolve(self, path):
+        """
+        Returns the definition of a JSON file, parsing it only if it changed since it was stored.
+        """
+        entry = self.index["sources"].get(os.path.abspath(path))
+        if entry is not None:
+            stat = os.stat(path)
+            if entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+                data = self._read_object(entry[2])
+                if data is not None:
+                    return pickle.loads(data)
+        return self.get(self.add_file(path))
+
+    def load(self, protocol, source, slot):
+        """
+        Load a labware onto the deck of an Opentrons protocol.
+        :param source: path to a JSON definition, or the loadName or hash of a stored one
+        """
+        if isinstance(source, Path) or str(source).endswith(".json"):
+            definition = self.resolve(source)
+        else:
+            definition = self.get(source)
+        return protocol.load_labware_from_definition(definition, slot)
+
+_default_store = None
+
+def load_labware(protocol, source, slot, store=None):
+    """
+    Load a labware onto the deck of an Opentrons protocol through a store, by default the one in
+    data/.labware_store.
+    :param source: path to a JSON definition, or the loadName or hash of a stored one
+    """
+    global _default_store
+    if store is None:
+        if _default_store is None:
+            _default_store = LabwareStore()
+        store = _default_store
+    return store.load(protocol, source, slot)
+
+def main(argv=None):
+    import argparse
+    from .generate_catalog import find_files
+
+    parser = argparse.ArgumentParser(description="Add labware definitions to the local store.")
+    parser.add_argument("inputs", nargs="+", help="JSON definitions, directories or glob patterns")
+    parser.add_argument("--store", type=Path, default=DEFAULT_STORE_PATH,
+                        help="directory of the store")
+    args = parser.parse_args(argv)
+
+    store = LabwareStore(args.store)
+    for path in find_files(args.inputs, "*.json"):
+        with open(path, encoding="utf-8") as file:
+            definition = json.load(file)
+        if not definition.get("parameters", {}).get("loadName"):
+            print(f"skipped {path}: not a labware definition with a loadName")
+            continue
+        digest = store.add(definition, path)
+        print(f"{definition['parameters']['loadName']} {digest[:12]} {path}")
+
+if __name__ == "__main__":
+    main()
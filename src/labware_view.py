@@ -0,0 +1,266 @@
+"""
+Read-only view of a labware definition file that only decodes what is looked up.
+
+The file is memory-mapped and scanned once for where each top-level section and each well starts
+and ends. Sections and wells are then decoded from their own bytes when they are first accessed,
+so tools that only need the well names, the dimensions or a few wells never parse the rest.
+Works on pretty and compact definitions alike.
+
+Scanning a large file costs about as much as parsing it, so the positions are kept in memory for
+the rest of the process, stamped with the file's modification time and size, and optionally as a
+pickle per file in an index directory such as DEFAULT_INDEX_DIR. Opening an unchanged file again
+only loads the positions. Without an index directory, the first open in a process scans the
+whole file, which is slower than json.load, so the view pays off for callers that keep an index
+or open the same file repeatedly.
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import re
+from array import array
+from collections.abc import Mapping
+from .atomic_io import atomic_write
+from .labware_store import DEFAULT_STORE_PATH
+
+# bump when the layout of the pickled positions changes
+INDEX_VERSION = 1
+DEFAULT_INDEX_DIR = DEFAULT_STORE_PATH / "views"
+
+_STRING_PATTERN = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(_STRING_PATTERN)
+_SEPARATOR = re.compile(rb"[ \t\n\r]*([,:}\]])")
+# everything up to and including the next bracket that is not inside a string
+_TO_BRACKET = re.compile(rb'[^\[\]{}"]*(?:' + _STRING_PATTERN + rb'[^\[\]{}"]*)*([\[\]{}])')
+_SCALAR = re.compile(rb"[^,}\]\s]+")
+# one "name": {...} entry of the wells section; well dictionaries have no nested containers
+_WELL = re.compile(rb'\s*(' + _STRING_PATTERN + rb')\s*:\s*'
+                   rb'(\{[^{}\[\]"]*(?:' + _STRING_PATTERN + rb'[^{}\[\]"]*)*\})\s*(,?)')
+
+# absolute path -> (stamp, positions) of every file opened in this process
+_indexes = {}
+
+def _key(data):
+    """
+    Decode a JSON string token.
+    """
+    return data[1:-1].decode() if b"\\" not in data else json.loads(data)
+
+def _skip_value(buffer, position):
+    """
+    :return: position just after the JSON value that starts at position
+    """
+    first = buffer[position:position + 1]
+    if first == b'"':
+        return _STRING.match(buffer, position).end()
+    if first not in (b"{", b"["):
+        return _SCALAR.match(buffer, position).end()
+    depth = 1
+    position += 1
+    while depth:
+        match = _TO_BRACKET.match(buffer, position)
+        if match is None:
+            raise ValueError(f"Unterminated JSON container at byte {position}.")
+        depth += 1 if match.group(1) in (b"{", b"[") else -1
+        position = match.end()
+    return position
+
+class WellsView(Mapping):
+    """
+    The "wells" section of a LabwareView: well names in file order, each well decoded on access.
+    """
+    def __init__(self, buffer, names, offsets):
+        """
+        :param names: well names in file order
+        :param offsets: start and end of every well in the file, two per name
+        """
+        self._buffer = buffer
+        self._names = names
+        self._offsets = offsets
+        self._index = dict(zip(names, range(len(names))))
+        self._wells = {}
+
+    def __getitem__(self, name):
+        well = self._wells.get(name)
+        if well is None:
+            i = 2 * self._index[name]
+            well = json.loads(self._buffer[self._offsets[i]:self._offsets[i + 1]])
+            self._wells[name] = well
+        return well
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+class LabwareView(Mapping):
+    """
+    Read-only, lazily decoded labware definition backed by a memory map of the JSON file.
+    Behaves like the definition dictionary: view["dimensions"], view["wells"]["A1"],
+    list(view["wells"]) for the well names. Decoded values are cached and must not be modified.
+    Use it as a context manager, or call close(); the file cannot be replaced on Windows while
+    it is mapped.
+    """
+    def __init__(self, path, index_dir=None):
+        """
+        :param index_dir: where the positions of scanned files are kept between processes, e.g.
+            DEFAULT_INDEX_DIR, or None to only keep them in memory. Failing to write there, e.g.
+            on a read-only checkout, only means the file is scanned again next time.
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._find_positions(path, stat, index_dir)
+        except BaseException:
+            self._buffer.close()
+            raise
+
+    def _find_positions(self, path, stat, index_dir):
+        self._values = {}
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = os.path.abspath(path)
+        cached = _indexes.get(key)
+        if cached is None or cached[0] != stamp:
+            positions = None
+            if index_dir is not None:
+                index_path = (os.path.join(index_dir, hashlib.sha1(key.encode()).hexdigest())
+                              + ".pickle")
+                positions = self._load_positions(index_path, stamp)
+            if positions is None:
+                positions = self._scan()
+                if index_dir is not None:
+                    self._save_positions(index_path, stamp, positions)
+            cached = (stamp, positions)
+            _indexes[key] = cached
+        self._spans, self._well_names, self._well_offsets = cached[1]
+
+    @staticmethod
+    def _load_positions(index_path, stamp):
+        try:
+            with open(index_path, "rb") as file:
+                version, index_stamp, positions = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if version != INDEX_VERSION or index_stamp != stamp:
+            return None
+        return positions
+
+    @staticmethod
+    def _save_positions(index_path, stamp, positions):
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with atomic_write(index_path, "wb") as file:
+                pickle.dump((INDEX_VERSION, stamp, positions), file, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass  # the positions are still kept in memory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._values.clear()
+        self._buffer.close()
+
+    def _scan(self):
+        """
+        Find where every top-level section and every well starts and ends.
+        :return: tuple of the sections' (start, end) by key, and the well names and their offsets,
+            or None for both if the wells section has to be decoded as a whole
+        """
+        buffer = self._buffer
+        spans = {}
+        wells = (None, None)
+        position = _WHITESPACE.match(buffer, 0).end()
+        if buffer[position:position + 1] != b"{":
+            raise ValueError(f"{self.path} is not a JSON object.")
+        position = _WHITESPACE.match(buffer, position + 1).end()
+        if buffer[position:position + 1] == b"}":
+            return spans, None, None
+        while True:
+            match = _STRING.match(buffer, position)
+            if match is None:
+                raise ValueError(f"Expected a key at byte {position} of {self.path}.")
+            key = _key(match.group())
+            separator = _SEPARATOR.match(buffer, match.end())
+            if separator is None or separator.group(1) != b":":
+                raise ValueError(f"Expected ':' after key '{key}' in {self.path}.")
+            start = _WHITESPACE.match(buffer, separator.end()).end()
+            if key == "wells":
+                end, *wells = self._scan_wells(start)
+            else:
+                end = _skip_value(buffer, start)
+            spans[key] = (start, end)
+            separator = _SEPARATOR.match(buffer, end)
+            if separator is None or separator.group(1) not in (b",", b"}"):
+                raise ValueError(f"Expected ',' or '}}' after '{key}' in {self.path}.")
+            if separator.group(1) == b"}":
+                return (spans, *wells)
+            position = _WHITESPACE.match(buffer, separator.end()).end()
+
+    def _scan_wells(self, start):
+        """
+        Record where every well starts and ends. Falls back to skipping the section as a whole
+        if a well does not have the usual flat layout; it is then decoded in one piece.
+        :return: position just after the wells section, the well names and their offsets
+        """
+        buffer = self._buffer
+        names = []
+        offsets = array('q')
+        position = start + 1
+        if buffer[start:start + 1] == b"{":
+            while True:
+                match = _WELL.match(buffer, position)
+                if match is None:
+                    break
+                names.append(_key(match.group(1)))
+                offsets.extend(match.span(2))
+                position = match.end()
+                if not match.group(3):
+                    break
+            closing = _WHITESPACE.match(buffer, position).end()
+            if buffer[closing:closing + 1] == b"}" and not buffer[position - 1:position] == b",":
+                return closing + 1, names, offsets
+        return _skip_value(buffer, start), None, None
+
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        if key == "wells" and self._well_names is not None:
+            value = WellsView(self._buffer, self._well_names, self._well_offsets)
+        else:
+            start, end = self._spans[key]
+            value = json.loads(self._buffer[start:end])
+        self._values[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, key):
+        return key in self._spans
+
+    def well_names(self):
+        """
+        Names of the wells in file order, without decoding any well.
+        """
+        return list(self["wells"])
+
+    def to_definition(self):
+        """
+        The whole definition as an ordinary dictionary.
+        """
+        return json.loads(self._buffer[:])
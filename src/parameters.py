@@ -0,0 +1,119 @@
+import csv
+
+def _number(cell):
+    """
+    Parse a numeric cell, keeping whole numbers as ints so they serialize without '.0'.
+    """
+    if cell.isdigit():
+        return int(cell)
+    value = float(cell)
+    return int(value) if value.is_integer() else value
+
+def _integer(cell):
+    return int(cell)
+
+def _text(cell):
+    return cell
+
+# type of every parameter understood by Regular and MultipleGrids
+PARAMETER_TYPES = {
+    "xDimension": _number,
+    "yDimension": _number,
+    "zDimension": _number,
+    "rows": _integer,
+    "cols": _integer,
+    "volume": _number,
+    "well_shape": _text,
+    "bottom_shape": _text,
+    "well_depth": _number,
+    "well_diameter": _number,
+    "well_xDimension": _number,
+    "well_yDimension": _number,
+    "x_spacing": _number,
+    "y_spacing": _number,
+    "x_offset": _number,
+    "y_offset": _number,
+    "display_name": _text,
+    "load_name": _text,
+    "display_category": _text,
+    "tipLength": _number,
+}
+
+_TYPE_NAMES = {_number: "a number", _integer: "an integer", _text: "text"}
+
+def parse_value(key, cell, location=""):
+    """
+    Convert one cell to the declared type of its parameter.
+    :param location: file and line of the cell, used in error messages
+    """
+    try:
+        parse = PARAMETER_TYPES[key]
+    except KeyError:
+        raise ValueError(f"{location}Unknown parameter '{key}'.") from None
+    try:
+        return parse(cell)
+    except ValueError:
+        raise ValueError(f"{location}Parameter '{key}' must be {_TYPE_NAMES[parse]}, "
+                         f"got '{cell}'.") from None
+
+def read_grids(path):
+    """
+    Reads a parameter CSV with one parameter per line and one column per grid:
+    key, value for grid 1, value for grid 2, ...
+    Empty cells (e.g. trailing commas) leave the parameter out of that grid.
+    :return: list with one dictionary of parameters per grid
+    """
+    grids = []
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file, skipinitialspace=True)
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            key = row[0].strip()
+            location = f"{path}, line {reader.line_num}: "
+            for i in range(1, len(row)):
+                if len(grids) < i:
+                    grids.append({})
+                cell = row[i].strip()
+                if cell:
+                    grids[i - 1][key] = parse_value(key, cell, location)
+    return grids
+
+def iter_labware(path):
+    """
+    Streams labware from a long-format CSV with a header line of parameter names and one
+    grid per line. A line without a load_name adds another grid to the labware above it.
+    :return: iterator of lists of grid parameter dictionaries, one list per labware
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file, skipinitialspace=True)
+        header = [cell.strip() for cell in next(reader, [])]
+        while header and not header[-1]:
+            header.pop()  # trailing commas
+        for key in header:
+            if key not in PARAMETER_TYPES:
+                raise ValueError(f"{path}, line 1: Unknown parameter '{key}'.")
+
+        columns = [(key, PARAMETER_TYPES[key]) for key in header]
+        labware = []
+        for row in reader:
+            cells = [cell.strip() for cell in row]
+            if not any(cells):
+                continue
+            if any(cells[len(header):]):
+                raise ValueError(f"{path}, line {reader.line_num}: Expected at most "
+                                 f"{len(header)} values, got {len(row)}.")
+            try:
+                grid = {key: parse(cell) for (key, parse), cell in zip(columns, cells) if cell}
+            except ValueError:
+                # parse again cell by cell to report which one is invalid
+                for key, cell in zip(header, cells):
+                    if cell:
+                        parse_value(key, cell, f"{path}, line {reader.line_num}: ")
+                raise
+            if labware and "load_name" in grid:
+                yield labware
+                labware = []
+            labware.append(grid)
+        if labware:
+            yield labware
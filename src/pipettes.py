@@ -0,0 +1,43 @@
+class PipetteProfile:
+    """
+    Reach and nozzle layout of an Opentrons pipette.
+    The nozzle offsets are computed once per profile, so checking many labware against the same
+    pipette only has to look up where each nozzle lands.
+    """
+    __slots__ = ("name", "channels", "max_height", "nozzle_pitch", "nozzle_offsets")
+
+    def __init__(self, name, channels, max_height, nozzle_pitch=9.0):
+        """
+        :param name: the Opentrons instrument name, e.g. 'p300_multi_gen2'
+        :param channels: number of nozzles, 1 or 8
+        :param max_height: tallest labware the pipette can reach into with a tip attached, in mm
+            (maximum travel minus tip length)
+        :param nozzle_pitch: distance between neighbouring nozzles along y, in mm
+        """
+        self.name = name
+        self.channels = channels
+        self.max_height = max_height
+        self.nozzle_pitch = nozzle_pitch
+        # y offset of every nozzle from the back (row A) nozzle, which is the one that is aimed
+        self.nozzle_offsets = tuple(-i * nozzle_pitch for i in range(channels))
+
+    def __repr__(self):
+        return f"PipetteProfile({self.name!r}, {self.channels}, {self.max_height})"
+
+PIPETTES = {profile.name: profile for profile in (
+    PipetteProfile("p1000_single_gen2", 1, 223.46 - 78.3),
+    PipetteProfile("p300_single_gen2", 1, 202.77 - 51),
+    PipetteProfile("p20_single_gen2", 1, 183.77 - 31.1),
+    PipetteProfile("p300_multi_gen2", 8, 192.44 - 51),
+    PipetteProfile("p20_multi_gen2", 8, 176 - 31.1),
+)}
+
+def get_pipette(name):
+    """
+    Look up a pipette profile by its Opentrons instrument name.
+    """
+    try:
+        return PIPETTES[name]
+    except KeyError:
+        raise ValueError(f"Unknown pipette '{name}'. Options are "
+                         f"{', '.join(repr(name) for name in PIPETTES)}.") from None
@@ -0,0 +1,163 @@
+"""
+JSON output for labware definitions, status files and reports, in one of three styles:
+- 'pretty': indented by 4 spaces, byte for byte what json.dump(data, file, indent=4) writes
+- 'compact': no whitespace, for caches and large catalogs
+- 'canonical': compact with sorted keys, the same bytes for the same data whichever backend is
+  installed, so the output can be hashed and diffed
+Containers near the top of the document (the definition and e.g. its "wells") are written entry
+by entry, so the whole document is never built as one string. Compact output uses orjson when
+it is installed, which writes NaN and infinity as null instead of the json module's NaN and
+Infinity.
+"""
+import io
+import json
+from json.encoder import encode_basestring_ascii
+
+STYLES = ("pretty", "compact", "canonical")
+INDENT = " " * 4
+# containers this many levels deep or deeper are encoded in one piece instead of entry by entry
+STREAM_DEPTH = 2
+
+_compact = json.JSONEncoder(separators=(",", ":")).encode
+_canonical = json.JSONEncoder(separators=(",", ":"), sort_keys=True, allow_nan=False).encode
+_FLOAT_CONSTANTS = {"nan": "NaN", "inf": "Infinity", "-inf": "-Infinity"}
+# encoder of compact output, picked on the first compact dump so importing this module does not
+# load orjson
+_compact_encoder = None
+
+def _scalar(value):
+    """
+    JSON of a number, string, bool or None, exactly as the json module writes it.
+    """
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        text = float.__repr__(value)
+        return _FLOAT_CONSTANTS.get(text, text)
+    return _compact(value)  # raises TypeError for anything json cannot encode
+
+def _key(key):
+    """
+    JSON of a dictionary key; numbers, bools and None are turned into strings like json does.
+    """
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    if key is None or isinstance(key, (int, float)):
+        return encode_basestring_ascii(_scalar(key))
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+def _pretty(value, level):
+    """
+    Indented JSON of a value nested level containers deep.
+    """
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        inner = "\n" + INDENT * (level + 1)
+        return ("{" + inner
+                + ("," + inner).join(f"{_key(key)}: {_pretty(item, level + 1)}"
+                                     for key, item in value.items())
+                + "\n" + INDENT * level + "}")
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        inner = "\n" + INDENT * (level + 1)
+        return ("[" + inner + ("," + inner).join(_pretty(item, level + 1) for item in value)
+                + "\n" + INDENT * level + "]")
+    return _scalar(value)
+
+def _write_pretty(value, write, level=0):
+    if level >= STREAM_DEPTH or not value or not isinstance(value, (dict, list, tuple)):
+        write(_pretty(value, level))
+        return
+    inner = "\n" + INDENT * (level + 1)
+    if isinstance(value, dict):
+        write("{")
+        separator = inner
+        for key, item in value.items():
+            write(f"{separator}{_key(key)}: ")
+            _write_pretty(item, write, level + 1)
+            separator = "," + inner
+        write("\n" + INDENT * level + "}")
+    else:
+        write("[")
+        separator = inner
+        for item in value:
+            write(separator)
+            _write_pretty(item, write, level + 1)
+            separator = "," + inner
+        write("\n" + INDENT * level + "]")
+
+def _get_compact_encoder():
+    global _compact_encoder
+    if _compact_encoder is None:
+        try:
+            import orjson
+        except ImportError:  # optional; only makes compact output faster
+            _compact_encoder = _compact
+        else:
+            def _orjson(value):
+                try:
+                    return orjson.dumps(value).decode()
+                except TypeError:
+                    # non-string keys and integers beyond 64 bits, which the json module still
+                    # handles
+                    return _compact(value)
+            _compact_encoder = _orjson
+    return _compact_encoder
+
+def _write_flat(value, write, encode, sort_keys, level=0):
+    """
+    Write compact JSON entry by entry down to STREAM_DEPTH, encoding deeper values with encode.
+    """
+    if level >= STREAM_DEPTH or not value or not isinstance(value, (dict, list, tuple)):
+        write(encode(value))
+        return
+    if isinstance(value, dict):
+        write("{")
+        items = sorted(value.items()) if sort_keys else value.items()
+        separator = ""
+        for key, item in items:
+            write(f"{separator}{_key(key)}:")
+            _write_flat(item, write, encode, sort_keys, level + 1)
+            separator = ","
+        write("}")
+    else:
+        write("[")
+        separator = ""
+        for item in value:
+            write(separator)
+            _write_flat(item, write, encode, sort_keys, level + 1)
+            separator = ","
+        write("]")
+
+def dump(data, file, style="pretty"):
+    """
+    Write data as JSON to a text file.
+    :param style: 'pretty', 'compact' or 'canonical'
+    """
+    if style == "pretty":
+        _write_pretty(data, file.write)
+    elif style == "compact":
+        _write_flat(data, file.write, _get_compact_encoder(), sort_keys=False)
+    elif style == "canonical":
+        _write_flat(data, file.write, _canonical, sort_keys=True)
+    else:
+        raise ValueError(f"Unknown JSON style '{style}'. Options are {', '.join(STYLES)}.")
+
+def dumps(data, style="pretty"):
+    """
+    JSON of data as a string.
+    :param style: 'pretty', 'compact' or 'canonical'
+    """
+    buffer = io.StringIO()
+    dump(data, buffer, style)
+    return buffer.getvalue()
@@ -1,38 +1,300 @@
-import json
+import heapq
+from contextlib import contextmanager
 from pathlib import Path
 
+# the status, labware and JSON modules are imported by the methods that use them, so importing
+# StatusGenerator stays cheap
+
 class StatusGenerator:
-    def __init__(self, labware_path, status_path):
-        self.labware_path = Path(labware_path)
+    def __init__(self, labware_path, status_path, style="pretty"):
+        """
+        :param labware_path: path to the labware JSON file, or an already loaded LabwareGeometry
+        :param style: how the status file is written, 'pretty', 'compact' or 'canonical'
+        """
+        from .labware_geometry import LabwareGeometry
+
+        if isinstance(labware_path, LabwareGeometry):
+            self.labware_path = None
+            self.labware_data = labware_path
+        else:
+            self.labware_path = Path(labware_path)
+            self.labware_data = None
         self.status_path = Path(status_path)
-        self.labware_data = None
+        self.style = style
         self.filtration_status = None
+        self.generation = None  # of the status snapshot that was loaded
 
     def generate_status_file(self, reset_status=False):
+        from .status_store import status_lock
+
         self.load_labware()
-        if reset_status or not self.status_path.exists():
-            self.initialize_status()
-        else:
-            self.load_status()
-        self.save_status_data()
+        # other processes may be writing the status, so read and rewrite it under their lock
+        with status_lock(self.status_path):
+            if reset_status or not self.status_path.exists():
+                self.initialize_status()
+            else:
+                self.load_status()
+            self.save_status_data()
 
     def load_labware(self):
+        if self.labware_path is None:
+            return
+        import json
+
         with open(self.labware_path, 'r', encoding='utf-8') as file:
             self.labware_data = json.load(file)
 
     def initialize_status(self):
-        self.filtration_status = {well: 'CLEAN' for well in self.labware_data['wells']}
+        from .labware_geometry import LabwareGeometry
+
+        if isinstance(self.labware_data, LabwareGeometry):
+            wells = self.labware_data.names
+        else:
+            wells = self.labware_data['wells']
+        self.filtration_status = {well: 'CLEAN' for well in wells}
+        self.generation = None  # unknown, so save_status_data reads it from the file
 
     def load_status(self):
-        with open(self.status_path, 'r', encoding='utf-8') as file:
-            self.filtration_status = json.load(file)
+        from .status_store import read_status
+
+        self.filtration_status, self.generation = read_status(self.status_path, generation=True)
 
     def save_status_data(self):
-        with open(self.status_path, 'w', encoding='utf-8') as file:
-            json.dump(self.filtration_status, file, indent=4)
+        """
+        Rewrite the whole status file. Call with the status_lock held, as generate_status_file does.
+        Transitions journaled by StatusStore are dropped, since the snapshot now holds every well.
+        """
+        from .status_store import replace_status
+
+        self.generation = replace_status(self.status_path, self.filtration_status, self.style,
+                                         self.generation)
+
+class WellAllocator(StatusGenerator):
+    """
+    Hands out CLEAN wells in the column ordering of the labware and records their transitions
+    through a StatusStore. The CLEAN wells are kept in a heap of positions in the ordering, so
+    the next free well is found in O(log n) instead of by scanning the status of every well.
+    Heap entries of wells that left CLEAN some other way are skipped when they come up.
+    """
+    def __init__(self, labware_path, status_path, style="pretty", pair_rows=None,
+                 compact_every=64):
+        """
+        :param pair_rows: for labware whose wells work in pairs, the row offset from a well to its
+            partner, e.g. -3 for the filtration plate, where D1 drains into A1
+        :param compact_every: number of journaled transitions after which the status file is
+            rewritten, see StatusStore
+        """
+        super().__init__(labware_path, status_path, style)
+        self.pair_rows = pair_rows
+        self.compact_every = compact_every
+        self.store = None
+        self.rank = {}
+        self.by_state = {}
+        self.partner = {}
+        self.partnered = {}
+        self._names = []
+        self._free = []
+        self._free_pairs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self, reset_status=False):
+        """
+        Create or load the status file and build the indexes.
+        :return: the allocator, so it can be used as a context manager
+        """
+        from .status_store import StatusStore
+
+        self.generate_status_file(reset_status)
+        self.store = StatusStore(self.status_path, self.compact_every, self.style)
+        self.filtration_status = self.store.status
+        self._build_indexes()
+        return self
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    def _build_indexes(self):
+        from .labels import parse_well_name, well_name
+        from .labware_geometry import LabwareGeometry
+        from .status_store import CLEAN, STATES
+
+        if isinstance(self.labware_data, LabwareGeometry):
+            ordering = self.labware_data.definition.get("ordering", ())
+        else:
+            ordering = self.labware_data.get("ordering", ())
+        self.rank = {}
+        for column in ordering:
+            for well in column:
+                self.rank.setdefault(well, len(self.rank))
+        for well in self.filtration_status:
+            self.rank.setdefault(well, len(self.rank))
+        self._names = sorted(self.rank, key=self.rank.get)
+
+        self.by_state = {state: set() for state in STATES}
+        for well, state in self.filtration_status.items():
+            self.by_state[state].add(well)
+
+        self.partner = {}
+        self.partnered = {}
+        if self.pair_rows is not None:
+            for well in self.filtration_status:
+                row_index, col = parse_well_name(well)
+                if row_index + self.pair_rows < 0:
+                    continue
+                partner = well_name(row_index + self.pair_rows, col)
+                if partner in self.filtration_status:
+                    self.partner[well] = partner
+                    self.partnered.setdefault(partner, []).append(well)
+
+        # sorted lists are valid heaps
+        self._free = sorted(self.rank[well] for well in self.by_state[CLEAN])
+        self._free_pairs = sorted(self.rank[well] for well in self.partner
+                                  if self._pair_is_free(well))
+
+    def _pair_is_free(self, well):
+        from .status_store import CLEAN
+
+        clean = self.by_state[CLEAN]
+        return well in clean and self.partner[well] in clean
+
+    def _index_state(self, well, state):
+        from .status_store import CLEAN
+
+        for wells_in_state in self.by_state.values():
+            wells_in_state.discard(well)
+        self.by_state[state].add(well)
+        if state == CLEAN:
+            heapq.heappush(self._free, self.rank[well])
+            for primary in (well, *self.partnered.get(well, ())):
+                if primary in self.partner and self._pair_is_free(primary):
+                    heapq.heappush(self._free_pairs, self.rank[primary])
+
+    def _transition(self, wells, state):
+        self.store.set_many(wells, state)
+        for well in wells:
+            self._index_state(well, state)
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the status lock, with the indexes updated for what other processes changed.
+        """
+        with self.store.locked() as changed:
+            for well, state in changed.items():
+                self._index_state(well, state)
+            yield
+
+    def available(self):
+        """
+        Number of CLEAN wells.
+        """
+        from .status_store import CLEAN
+
+        with self._locked():
+            return len(self.by_state[CLEAN])
+
+    def allocate(self, count=1):
+        """
+        Mark the next count CLEAN wells in column order as ONGOING.
+        :return: list of the allocated well names
+        """
+        from .status_store import CLEAN, ONGOING
+
+        with self._locked():
+            clean = self.by_state[CLEAN]
+            if count > len(clean):
+                raise RuntimeError(f"Only {len(clean)} clean wells left, {count} needed.")
+            wells = []
+            popped = []
+            try:
+                while len(wells) < count:
+                    rank = heapq.heappop(self._free)
+                    well = self._names[rank]
+                    if well in clean and well not in wells:
+                        wells.append(well)
+                        popped.append(rank)
+                self._transition(wells, ONGOING)
+            except BaseException:
+                # the wells are still CLEAN, so they go back into the heap
+                for rank in popped:
+                    heapq.heappush(self._free, rank)
+                raise
+        return wells
+
+    def allocate_pairs(self, count=1):
+        """
+        Mark the next count wells whose partner is CLEAN as well as ONGOING, together with
+        their partners. Needs pair_rows.
+        :return: list of (well, partner) tuples
+        """
+        from .status_store import ONGOING
+
+        if self.pair_rows is None:
+            raise ValueError("Paired allocation needs pair_rows.")
+        with self._locked():
+            pairs = []
+            taken = set()
+            # every free pair taken off the heap, including those that share a well with a pair
+            # already chosen; after a successful allocation those are no longer free
+            popped = []
+            try:
+                while len(pairs) < count:
+                    if not self._free_pairs:
+                        raise RuntimeError(
+                            f"Only {len(pairs)} clean well pairs left, {count} needed.")
+                    rank = heapq.heappop(self._free_pairs)
+                    well = self._names[rank]
+                    if not self._pair_is_free(well):
+                        continue
+                    popped.append(rank)
+                    partner = self.partner[well]
+                    if well not in taken and partner not in taken:
+                        pairs.append((well, partner))
+                        taken.update((well, partner))
+                self._transition([well for pair in pairs for well in pair], ONGOING)
+            except BaseException:
+                # the pairs are still CLEAN, so they go back into the heap
+                for rank in popped:
+                    heapq.heappush(self._free_pairs, rank)
+                raise
+        return pairs
+
+    def release(self, wells):
+        """
+        Return ONGOING wells that were not used to CLEAN.
+        """
+        from .status_store import CLEAN
+
+        with self._locked():
+            self._transition(wells, CLEAN)
+
+    def mark_used(self, wells):
+        """
+        Mark ONGOING wells as USED.
+        """
+        from .status_store import USED
+
+        with self._locked():
+            self._transition(wells, USED)
+
+    def reset(self):
+        """
+        Set every well back to CLEAN.
+        """
+        with self.store.locked():
+            self.store.reset()
+            self._build_indexes()
 
-labware_file_path = "../data/filtration.json"
-status_file_path = "../data/filtration_status.json"
+def main():
+    data_dir = Path(__file__).parent.parent / "data"
+    generator = StatusGenerator(data_dir / "filtration.json", data_dir / "filtration_status.json")
+    generator.generate_status_file()
 
-generator = StatusGenerator(labware_file_path, status_file_path)
-generator.generate_status_file()
+if __name__ == "__main__":
+    main()
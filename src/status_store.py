@@ -0,0 +1,386 @@
+"""
+Well status kept as a snapshot plus an append-only journal of transitions.
+
+<status>.json           snapshot, the {well: state} map StatusGenerator writes, plus the
+                        "_generation" it was written in
+<status>.json.journal   one JSON line per transition, e.g.
+                        {"well":"A1","state":"ONGOING","generation":3}
+
+Changing one well appends and fsyncs one line, instead of rewriting every well. Once the journal
+holds compact_every lines, or the status is reset, the snapshot is rewritten atomically as the
+next generation and the journal is emptied in place. Journal lines only apply to the snapshot of
+their own generation, so lines left behind by a writer that crashed before emptying the journal
+are skipped, and a reset is never undone by replaying older transitions. A crash leaves at worst
+a torn last journal line, which is ignored.
+
+Any number of processes can read the status with read_status() without locking. Writers, in
+this or other processes or on other robots sharing the directory, take an advisory lock on
+<status>.json.lock, catch up on the lines the others appended, and only then check and journal
+their own transitions, so no update is lost and every transition is a compare-and-swap. Files
+are only held open for one read or write, so on Windows no writer or reader keeps another from
+truncating the journal or replacing the snapshot.
+
+Usage: python -m src.status_store race data/filtration_status.json -p 8
+"""
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from .atomic_io import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+GENERATION_KEY = "_generation"
+CLEAN = "CLEAN"
+ONGOING = "ONGOING"
+USED = "USED"
+STATES = (CLEAN, ONGOING, USED)
+# the states each state may move on to; an ONGOING well that was not used can be released back
+# to CLEAN, USED wells only through reset()
+TRANSITIONS = {CLEAN: {ONGOING}, ONGOING: {USED, CLEAN}}
+
+def journal_path(status_path):
+    return Path(f"{status_path}.journal")
+
+def lock_path(status_path):
+    return Path(f"{status_path}.lock")
+
+@contextmanager
+def status_lock(status_path):
+    """
+    Hold the exclusive lock that every writer of a status file takes, blocking until it is free.
+    """
+    with open(lock_path(status_path), "ab") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _stamp(path):
+    """
+    Identifies one version of a file that is only ever replaced, never modified in place.
+    """
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _load_snapshot(file):
+    """
+    :return: the {well: state} map of an open snapshot, and its generation
+    """
+    status = json.load(file)
+    return status, status.pop(GENERATION_KEY, 0)
+
+def _replay(file, status, generation):
+    """
+    Apply the journal lines of an open binary file that belong to the snapshot of generation to
+    status. Lines of older generations are skipped.
+    :return: number of lines read and their length in bytes, so a torn last line can be cut off,
+        and whether a line of a newer generation was found, i.e. the snapshot is out of date
+    """
+    count = valid = 0
+    for line in file:
+        if not line.endswith(b"\n"):
+            break
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break
+        line_generation = entry.get("generation", 0)
+        if line_generation > generation:
+            return count, valid, True
+        if line_generation == generation:
+            status[entry["well"]] = entry["state"]
+        count += 1
+        valid += len(line)
+    return count, valid, False
+
+def read_status(status_path, generation=False):
+    """
+    Current status of every well: the snapshot with the journal applied.
+    Safe to call while another process writes the status.
+    :param generation: also return the generation of the snapshot, for replace_status
+    """
+    status_path = Path(status_path)
+    path = journal_path(status_path)
+    while True:
+        with open(status_path, encoding="utf-8") as file:
+            inode = os.fstat(file.fileno()).st_ino
+            status, snapshot_generation = _load_snapshot(file)
+        try:
+            with open(path, "rb") as file:
+                _, _, newer = _replay(file, status, snapshot_generation)
+        except FileNotFoundError:
+            newer = False
+        # the snapshot is replaced before the journal is emptied, so if it is still the same
+        # file, the journal read was neither cut short nor newer than the snapshot
+        if newer or os.stat(status_path).st_ino != inode:
+            continue
+        return (status, snapshot_generation) if generation else status
+
+def replace_status(status_path, status, style="pretty", generation=None):
+    """
+    Write status as the snapshot of the next generation and empty the journal in place, so no
+    transition journaled against an older snapshot is applied to it. The journal is truncated
+    rather than replaced, which other processes having it open does not prevent on Windows.
+    Call with the status_lock held.
+    :param generation: generation of the current snapshot, read from it if None
+    :return: the generation of the new snapshot
+    """
+    status_path = Path(status_path)
+    if generation is None:
+        try:
+            with open(status_path, encoding="utf-8") as file:
+                _, generation = _load_snapshot(file)
+        except (FileNotFoundError, ValueError):
+            generation = 0
+    generation += 1
+    write_json_atomic(status_path, dict(status, **{GENERATION_KEY: generation}), style)
+    path = journal_path(status_path)
+    if path.exists():
+        with open(path, "wb"):
+            pass
+    return generation
+
+class StatusStore:
+    """
+    Writer of the well status of one labware. Use it as a context manager, or call close().
+    self.status is brought up to date with other writers whenever the lock is taken, and kept as
+    the same dictionary, so it can be shared.
+    """
+    def __init__(self, status_path, compact_every=64, style="pretty"):
+        """
+        :param status_path: the snapshot JSON file; it must exist, see StatusGenerator
+        :param compact_every: number of journal lines after which the snapshot is rewritten
+        :param style: how the snapshot is written, 'pretty', 'compact' or 'canonical'
+        """
+        self.status_path = Path(status_path)
+        self.journal_path = journal_path(self.status_path)
+        self.compact_every = compact_every
+        self.style = style
+        self.status = {}
+        self.generation = None  # of the snapshot self.status was read from
+        self.entries = 0
+        self._stamp = None  # of that snapshot
+        self._offset = 0  # bytes of the journal applied to self.status
+        self._locked = False
+        with self.locked():
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, well):
+        return self.status[well]
+
+    def __iter__(self):
+        return iter(self.status)
+
+    def items(self):
+        return self.status.items()
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the status lock and bring self.status up to date with what other writers journaled.
+        Reentrant, so several transitions can be made under one lock.
+        :return: dictionary of the wells other writers changed since the last update, with their
+            new state
+        """
+        if self._locked:
+            yield {}
+            return
+        with status_lock(self.status_path):
+            self._locked = True
+            try:
+                yield self._refresh()
+            finally:
+                self._locked = False
+
+    def _refresh(self):
+        stamp = _stamp(self.status_path)
+        if stamp == self._stamp:
+            changed = {}
+            count, valid = self._replay_journal(changed)
+            self.status.update(changed)
+            self.entries += count
+        else:
+            # first load, or another writer compacted the status: start over from the snapshot
+            with open(self.status_path, encoding="utf-8") as file:
+                status, self.generation = _load_snapshot(file)
+            self._stamp = stamp
+            self._offset = 0
+            self.entries, valid = self._replay_journal(status)
+            changed = {well: state for well, state in status.items()
+                       if self.status.get(well) != state}
+            self.status.clear()
+            self.status.update(status)
+        self._offset += valid
+        try:
+            size = os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            size = 0
+        if size > self._offset:
+            # torn last line of a writer that crashed
+            os.truncate(self.journal_path, self._offset)
+        return changed
+
+    def _replay_journal(self, status):
+        """
+        Apply the journal from self._offset on. The journal is only opened for as long as this
+        takes, so other processes can always truncate it.
+        """
+        try:
+            with open(self.journal_path, "rb") as file:
+                file.seek(self._offset)
+                count, valid, _ = _replay(file, status, self.generation)
+        except FileNotFoundError:
+            return 0, 0
+        return count, valid
+
+    def set(self, well, state):
+        """
+        Move a well on to its next state, e.g. from CLEAN to ONGOING.
+        """
+        self.set_many((well,), state)
+
+    def set_many(self, wells, state):
+        """
+        Move several wells to the same state with a single write and fsync.
+        Nothing is changed if any of the wells cannot make the transition, which is checked
+        against the latest status of every writer.
+        """
+        with self.locked():
+            for well in wells:
+                current = self.status.get(well)
+                if current is None:
+                    raise ValueError(f"Unknown well '{well}'.")
+                if state not in TRANSITIONS.get(current, ()):
+                    raise ValueError(f"Well {well} cannot go from {current} to {state}.")
+            data = b"".join(json.dumps({"well": well, "state": state,
+                                        "generation": self.generation},
+                                       separators=(",", ":")).encode() + b"\n"
+                            for well in wells)
+            with open(self.journal_path, "ab") as journal:
+                journal.write(data)
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._offset += len(data)
+            for well in wells:
+                self.status[well] = state
+            self.entries += len(wells)
+            if self.entries >= self.compact_every:
+                self.compact()
+
+    def compare_and_set(self, well, expected, state):
+        """
+        Move a well to state only if it is still in the expected state.
+        :return: True if the well was moved, False if another writer changed it first
+        """
+        with self.locked():
+            if self.status.get(well) != expected:
+                return False
+            self.set(well, state)
+            return True
+
+    def reset(self, status=None):
+        """
+        Replace the whole status, by default setting every well back to CLEAN.
+        """
+        with self.locked():
+            if status is None:
+                status = {well: CLEAN for well in self.status}
+            status = dict(status)
+            self.status.clear()
+            self.status.update(status)
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the snapshot with the journal applied, as the next generation, and empty the
+        journal.
+        """
+        with self.locked():
+            self.generation = replace_status(self.status_path, self.status, self.style,
+                                             self.generation)
+            self._stamp = _stamp(self.status_path)
+            self._offset = 0
+            self.entries = 0
+
+    def close(self):
+        """
+        Nothing is kept open between operations; kept so the store can be used like a file.
+        """
+
+def _claim_all(status_path):
+    """
+    Claim CLEAN wells until none are left. Runs in a worker process of race().
+    """
+    claimed = []
+    with StatusStore(status_path, compact_every=8) as store:
+        for well in list(store):
+            if store.compare_and_set(well, CLEAN, ONGOING):
+                claimed.append(well)
+    return claimed
+
+def race(status_path, processes=8):
+    """
+    Let several processes claim every CLEAN well of a copy of a status file at once, and check
+    that each well was claimed exactly once and the final status holds every claim.
+    :return: number of wells each process claimed
+    """
+    import shutil
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "status.json"
+        shutil.copyfile(status_path, path)
+        clean = {well for well, state in read_status(path).items() if state == CLEAN}
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            claims = list(pool.map(_claim_all, [path] * processes))
+        claimed = [well for wells in claims for well in wells]
+        if len(claimed) != len(set(claimed)) or set(claimed) != clean:
+            raise ValueError("Some wells were claimed twice or not at all.")
+        status = read_status(path)
+        if any(status[well] != ONGOING for well in clean):
+            raise ValueError("Some claims are missing from the status file.")
+    return [len(wells) for wells in claims]
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check concurrent writers of a status file.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    race_parser = subparsers.add_parser(
+        "race", help="let several processes claim the CLEAN wells of a copy of the status file")
+    race_parser.add_argument("status", type=Path, help="status JSON file")
+    race_parser.add_argument("-p", "--processes", type=int, default=8,
+                             help="number of racing processes")
+    args = parser.parse_args(argv)
+
+    counts = race(args.status, args.processes)
+    print(f"{sum(counts)} wells claimed exactly once by {len(counts)} processes: {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+
+DEFAULT_TEMPLATE_PATH = Path(__file__).parent.parent / 'data' / 'default.json'
+
+_cache = {}
+_lock = threading.Lock()
+
+def load_template(path: Path = None):
+    """
+    Returns a fresh copy of a parsed JSON template.
+    Each template is parsed once per process and kept as a pickle, which is much faster to
+    clone than re-reading the file or deep-copying the dict. It is re-read when the file's
+    modification time or size changes.
+    :param path: the path to the JSON template file. Defaults to data/default.json.
+    """
+    if path is None:
+        path = DEFAULT_TEMPLATE_PATH
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        cached = _cache.get(key)
+        if cached is None or cached[0] != stamp:
+            with open(key, encoding="utf-8") as file:
+                template = json.load(file)
+            cached = (stamp, pickle.dumps(template, pickle.HIGHEST_PROTOCOL))
+            _cache[key] = cached
+
+    return pickle.loads(cached[1])
+
+def clear_template_cache():
+    """
+    Drops every cached template, e.g. when file timestamps are too coarse to show an edit.
+    """
+    with _lock:
+        _cache.clear()
@@ -1,19 +1,159 @@
 import json
 import math
+import os
+import time
+from .labware_geometry import LabwareGeometry, RECTANGULAR, UNKNOWN_SHAPE
+from .pipettes import PIPETTES, get_pipette
+
+# tallest labware every pipette can reach into
+MAX_LABWARE_HEIGHT = math.floor(min(profile.max_height for profile in PIPETTES.values()))
+
+def _footprints_overlap(dx, dy, shape1, half_x1, half_y1, shape2, half_x2, half_y2):
+    """
+    Check whether two circular or rectangular well footprints overlap.
+    :param dx: distance between the well centres along x
+    :param dy: distance between the well centres along y
+    """
+    circular1 = shape1 != RECTANGULAR
+    circular2 = shape2 != RECTANGULAR
+
+    if circular1 and circular2:
+        return math.hypot(dx, dy) < half_x1 + half_x2
+    if not circular1 and not circular2:
+        return abs(dx) < half_x1 + half_x2 and abs(dy) < half_y1 + half_y2
+
+    # circle against rectangle: distance from the circle centre to the closest rectangle point
+    radius, half_x, half_y = (half_x1, half_x2, half_y2) if circular1 else (
+        half_x2, half_x1, half_y1)
+    return math.hypot(max(abs(dx) - half_x, 0.0), max(abs(dy) - half_y, 0.0)) < radius
 
 class Verifier:
     """
     Class for verifying the generated dictionary or JSON file.
-    It can accept either a dictionary or a path to a JSON file.
+    It can accept either a dictionary, a LabwareGeometry or a path to a JSON file.
     """
-    def __init__(self, labware_def):
+    def __init__(self, labware_def, on_check=None):
+        """
+        :param on_check: optional hook called as on_check(check_name, seconds) after every check
+            that verify runs, e.g. to feed the timings into a metrics pipeline
+        """
         self.labware_def = labware_def
         self.data = None
+        self.geometry = None
+        self.on_check = on_check
+        self.timings = {}
+        self.findings = None
+        self._reported = set()
+        self._current_check = None
+
+    def verify(self, run_optional_checks=True, interactive=False, collect_errors=False,
+               pipettes=()):
+        """
+        Check the generated json file. The time taken by loading and by each check is recorded
+        in self.timings.
+        :param interactive: ask for confirmation on each volume warning instead of only printing
+        :param collect_errors: run every check to the end and return everything found instead of
+            raising at the first error. A definition that cannot be loaded still raises.
+        :return: list of {"check", "severity", "message"} findings when collect_errors is set,
+            where severity is 'error' or, for volume violations, 'warning'
+        :param pipettes: names of pipettes (see pipettes.PIPETTES) to run check_pipette for
+        """
+        self.timings = {}
+        self._run_check("load", self.load, collect_errors=False)
 
-    def verify(self, run_optional_checks=True):
+        self.findings = [] if collect_errors else None
+        self._reported = set()
+        try:
+            self._run_check("check_fields", self.check_fields)
+            self._run_check("check_shapes", self.check_shapes)
+            self._run_check("check_heights", self.check_heights)
+            self._run_check("check_well_positions", self.check_well_positions)
+            self._run_check("check_metadata", self.check_metadata)
+            self._run_check("check_dimensions", self.check_dimensions)
+            for pipette in pipettes:
+                self._run_check(f"check_pipette[{pipette}]",
+                                lambda pipette=pipette: self.check_pipette(pipette))
+
+            if run_optional_checks:
+                if collect_errors:
+                    self._run_check("check_volume", self._collect_volume_warnings)
+                else:
+                    self._run_check("check_volume", lambda: self.check_volume(interactive))
+            return self.findings
+        finally:
+            self.findings = None
+
+    def _run_check(self, name, check, collect_errors=True):
+        """
+        Run and time one check. While collecting, missing or malformed fields that make the
+        check fail with KeyError, TypeError or ValueError, e.g. a well without coordinates,
+        are recorded as an error instead of raised.
+        """
+        self._current_check = name
+        start = time.perf_counter()
+        try:
+            check()
+        except (KeyError, TypeError, ValueError) as e:
+            if not collect_errors or self.findings is None:
+                raise
+            self.findings.append({"check": name, "severity": "error",
+                                  "message": f"Missing or invalid field: {e!r}"})
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = seconds
+            self._current_check = None
+            if self.on_check is not None:
+                self.on_check(name, seconds)
+
+    def _fail(self, message):
+        """
+        Raise a ValueError, or record it and let the check carry on when collecting errors.
         """
-        Check the generated json file.
+        if self.findings is None:
+            raise ValueError(message)
+        # the same message can come up once per well, e.g. for wells deeper than the labware
+        if (self._current_check, message) not in self._reported:
+            self._reported.add((self._current_check, message))
+            self.findings.append({"check": self._current_check, "severity": "error",
+                                  "message": message})
+
+    def _collect_volume_warnings(self):
+        for violation in self.volume_violations():
+            self.findings.append({
+                "check": "check_volume", "severity": "warning",
+                "message": f"Well {violation['well']} volume {violation['totalLiquidVolume']} "
+                           f"exceeds physical limit {violation['maxVolume']}."})
+
+    def verify_wells(self, well_names):
+        """
+        Only re-check the given wells, e.g. the ones returned by MultipleGrids.update_grid,
+        against the plate and every other well. The definition is only loaded on the first call;
+        after that the given wells are copied over from the definition dictionary, so a call
+        costs about as much as the wells it checks. A JSON file is read again every time, and a
+        LabwareGeometry is used as it is, so update it with LabwareGeometry.update_well.
+        """
+        if self.geometry is None or isinstance(self.labware_def, str):
+            self.load()
+        elif isinstance(self.labware_def, dict):
+            wells = self.data["wells"]
+            # changing rows or cols renames wells, which needs the whole definition again
+            if len(wells) != len(self.geometry) or not all(
+                    name in self.geometry for name in well_names):
+                self.load()
+            else:
+                for name in well_names:
+                    self.geometry.update_well(name, wells[name])
+        self.check_fields(well_names)
+        self.check_well_positions(well_names)
+
+    def load(self):
         """
+        Load the labware definition into self.data and its wells into self.geometry.
+        """
+        if isinstance(self.labware_def, LabwareGeometry):
+            self.geometry = self.labware_def
+            self.data = self.labware_def.definition
+            return
         if isinstance(self.labware_def, dict):
             self.data = self.labware_def
         elif isinstance(self.labware_def, str):
@@ -27,79 +167,175 @@ class Verifier:
             except Exception as e:
                 raise ValueError(f"An error occurred: {e}")
         else:
-            raise ValueError("Invalid input type. Expected a dictionary or a path to a JSON file.")
-
-        self.check_shapes()
-        self.check_heights()
-        self.check_well_positions()
-        self.check_metadata()
-        self.check_dimensions()
+            raise ValueError("Invalid input type. Expected a dictionary, a LabwareGeometry "
+                             "or a path to a JSON file.")
+        self.geometry = LabwareGeometry.from_definition(self.data)
 
-        if run_optional_checks:
-            self.check_volume()
+    def check_fields(self, well_names=None):
+        """
+        Check every well has a position, a depth and a volume, and the diameter or x and y
+        dimensions of its shape.
+        :param well_names: only check these wells. Defaults to all wells.
+        """
+        for name, key in self.geometry.missing_fields(well_names):
+            self._fail(f"Well {[name]} is missing '{key}'.")
 
     def check_shapes(self):
         """
         Check well bottom shapes and well shapes are allowed shapes.
         """
         if self.data["groups"][0]["metadata"]["wellBottomShape"] not in ['flat', 'v', 'u']:
-            raise ValueError("Invalid well bottom shape. Options are 'flat', 'v', and 'u'.")
+            self._fail("Invalid well bottom shape. Options are 'flat', 'v', and 'u'.")
 
-        for well in self.data["wells"].keys():
-            if self.data["wells"][well]["shape"] not in ['circular', 'rectangular']:
-                raise ValueError("Invalid well shape. Options are 'circular' and 'rectangular'.")
+        if UNKNOWN_SHAPE in self.geometry.shape:
+            self._fail("Invalid well shape. Options are 'circular' and 'rectangular'.")
 
     def check_heights(self):
         """
         Check wells are not taller than max allowed height.
         """
-        # P1000, single - channel: 223.46 - 78.3 = 145.16 mm
-        # P300, single - channel: 202.77 - 51 = 151.77 mm
-        # P20, single - channel: 183.77 - 31.1 = 152.77 mm
-        # P300, 8 - channel: 192.44 - 51 = 141.44 mm
-        # P20, 8 - channel: 176 - 31.1 = 144.9 mm
-        max_height = 141
+        # the lowest reach of all pipettes in PIPETTES, the P300 8-channel's 141.44 mm
+        max_height = MAX_LABWARE_HEIGHT
         if self.data["dimensions"]["zDimension"] > max_height:
-            raise ValueError(f"Height of labware greater than allowed height, {max_height} mm.")
+            self._fail(f"Height of labware greater than allowed height, {max_height} mm.")
 
-    def check_well_positions(self):
+    def check_pipette(self, pipette):
+        """
+        Check the labware and every well can be reached by a pipette with a tip attached.
+        For multichannel pipettes, aiming the back nozzle at the first well of each column must
+        put every other nozzle, one nozzle pitch apart along y, inside a well as well.
+        :param pipette: a pipette name from pipettes.PIPETTES or a PipetteProfile
+        """
+        profile = get_pipette(pipette) if isinstance(pipette, str) else pipette
+        if self.data["dimensions"]["zDimension"] > profile.max_height:
+            self._fail(f"Height of labware greater than the {profile.max_height:.2f} mm "
+                       f"{profile.name} can reach.")
+
+        geometry = self.geometry
+        zs = geometry.columns["z"]
+        depths = geometry.columns["depth"]
+        for i, name in enumerate(geometry.names):
+            if zs[i] + depths[i] > profile.max_height:
+                self._fail(f"Well {[name]} is taller than the {profile.max_height:.2f} mm "
+                           f"{profile.name} can reach.")
+
+        if profile.channels == 1:
+            return
+        xs = geometry.columns["x"]
+        ys = geometry.columns["y"]
+        for column in self.data.get("ordering", ()):
+            if not column:
+                continue
+            i = geometry.index[column[0]]
+            for nozzle, offset in enumerate(profile.nozzle_offsets):
+                if geometry.find_well(xs[i], ys[i] + offset) is None:
+                    self._fail(f"Nozzle {nozzle + 1} of {profile.name} misses every well when "
+                               f"aimed at column {[column[0]]}.")
+                    break
+
+    def check_well_positions(self, well_names=None):
         """
         Check wells do not overlap in the xy plane and do not go out of bounds.
         Check well height/depth make sense.
+        Wells are bucketed into a grid of cells at least as wide as the largest well, so each
+        well is only compared against wells in its own and the eight neighbouring cells.
+        :param well_names: only check these wells (against all others). Defaults to all wells.
         """
-        well_keys = list(self.data["wells"].keys())
-        for i in range(len(well_keys)):
-            for j in range(i + 1, len(well_keys)):
-                well1 = self.data["wells"][well_keys[i]]
-                well2 = self.data["wells"][well_keys[j]]
+        geometry = self.geometry
+        names = geometry.names
+        xs = geometry.columns["x"]
+        ys = geometry.columns["y"]
+        zs = geometry.columns["z"]
+        depths = geometry.columns["depth"]
+        x_dim = self.data["dimensions"]["xDimension"]
+        y_dim = self.data["dimensions"]["yDimension"]
+        z_dim = self.data["dimensions"]["zDimension"]
+
+        if well_names is None:
+            checked = range(len(geometry))
+            # compare whole columns first and only look for the offending well if there is one
+            in_bounds = not names or (min(xs) >= 0 and min(ys) >= 0 and max(xs) <= x_dim
+                                      and max(ys) <= y_dim and max(depths) <= z_dim
+                                      and min(zs) >= 0)
+        else:
+            checked = [geometry.index[name] for name in dict.fromkeys(well_names)]
+            in_bounds = False
 
+        if not in_bounds:
+            for i in checked:
                 # check wells don't go beyond edges
-                if well1["x"] < 0 or well1["y"] < 0:
-                    raise ValueError(f"Well {[well_keys[i]]} goes out of bounds.")
-                if (well1["x"] > self.data["dimensions"]["xDimension"]
-                        or well1["y"] > self.data["dimensions"]["yDimension"]):
-                    raise ValueError(f"Well {[well_keys[i]]} goes out of bounds.")
+                if xs[i] < 0 or ys[i] < 0 or xs[i] > x_dim or ys[i] > y_dim:
+                    self._fail(f"Well {[names[i]]} goes out of bounds.")
 
                 # check zDimension > depth or z>=0 for each well
-                if self.data["dimensions"]["zDimension"] < well1["depth"] or well1["z"] < 0:
-                    raise ValueError("Labware must be taller than well depth.")
+                if z_dim < depths[i] or zs[i] < 0:
+                    self._fail("Labware must be taller than well depth.")
 
-                # check wells don't overlap
-                distance = math.dist([well1["x"], well1["y"]], [well2["x"], well2["y"]])
-                if distance < (well1["diameter"] / 2.0 + well2["diameter"] / 2.0):
-                    raise ValueError(f"Wells {[well_keys[i]]} and {[well_keys[j]]} overlap.")
+        # check wells don't overlap
+        if well_names is not None:
+            self._check_overlaps(checked)
+            return
+        shapes = geometry.shape
+        half_x, half_y = geometry.half_extents()
+        cell_size = 2 * max(max(half_x, default=0), max(half_y, default=0))
+        if cell_size <= 0:
+            return
+
+        # every well is compared against the wells added to the index before it, so every
+        # pair is only compared once
+        buckets = {}
+        for i in checked:
+            x, y = xs[i], ys[i]
+            cell_x, cell_y = math.floor(x / cell_size), math.floor(y / cell_size)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in buckets.get((cell_x + dx, cell_y + dy), ()):
+                        if _footprints_overlap(xs[j] - x, ys[j] - y,
+                                               shapes[j], half_x[j], half_y[j],
+                                               shapes[i], half_x[i], half_y[i]):
+                            self._fail(f"Wells {[names[j]]} and {[names[i]]} overlap.")
+            buckets.setdefault((cell_x, cell_y), []).append(i)
+
+    def _check_overlaps(self, checked):
+        """
+        Compare the given wells with their neighbours in the cell index the geometry keeps
+        between calls, so no other well is looked at.
+        :param checked: indices of the wells to check
+        """
+        geometry = self.geometry
+        names = geometry.names
+        xs = geometry.columns["x"]
+        ys = geometry.columns["y"]
+        shapes = geometry.shape
+        cell_size, half_x, half_y, buckets = geometry.cell_index()
+        if cell_size <= 0:
+            return
+        # a pair of checked wells is only compared from the later one
+        order = {i: position for position, i in enumerate(checked)}
+        for i in checked:
+            x, y = xs[i], ys[i]
+            cell_x, cell_y = math.floor(x / cell_size), math.floor(y / cell_size)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in buckets.get((cell_x + dx, cell_y + dy), ()):
+                        if j == i or order.get(j, -1) > order[i]:
+                            continue
+                        if _footprints_overlap(xs[j] - x, ys[j] - y,
+                                               shapes[j], half_x[j], half_y[j],
+                                               shapes[i], half_x[i], half_y[i]):
+                            self._fail(f"Wells {[names[j]]} and {[names[i]]} overlap.")
 
     def check_metadata(self):
         """
         Check volume units and category.
         """
         if self.data["metadata"]["displayVolumeUnits"] not in ['\u00b5L', 'mL']:
-            raise ValueError("Invalid display units. Options are 'μL' and 'mL'.")
+            self._fail("Invalid display units. Options are 'μL' and 'mL'.")
 
         if (self.data["metadata"]["displayCategory"] not in
                 ["wellPlate", "reservoir", "tubeRack", "aluminumBlock", "tipRack"]):
-            raise ValueError("Invalid category. Options are 'wellPlate', 'reservoir',"
-                             " 'tubeRack', 'aluminumBlock', and 'tipRack'.")
+            self._fail("Invalid category. Options are 'wellPlate', 'reservoir',"
+                       " 'tubeRack', 'aluminumBlock', and 'tipRack'.")
 
     def check_dimensions(self):
         """
@@ -107,28 +343,50 @@ class Verifier:
         """
         if (self.data["dimensions"]["xDimension"] > 130
                 or self.data["dimensions"]["yDimension"] > 88):
-            raise ValueError("Labware exceeds maximum allowed dimensions for Opentrons.")
+            self._fail("Labware exceeds maximum allowed dimensions for Opentrons.")
 
-    def check_volume(self):
+    def check_volume(self, interactive=False, bottom_correction=False, tolerance=15):
         """
         Check each well volume doesn't exceed the physical max based on well dimensions.
-        For v and u shaped bottoms, assume flat bottom.
-        """
-        well_keys = list(self.data["wells"].keys())
-        for i in range(len(well_keys)):
-            well = self.data["wells"][well_keys[i]]
-            vol = math.pi * well["depth"] * well["diameter"] * well["diameter"] / 4.0
-            tolerance = 15
-            if well["totalLiquidVolume"] > (vol + tolerance):
-                print(f"Warning: Well {well_keys[i]} volume exceeds physical limits. "
-                      "Double check well height, diameter, and volume.")
-                user_input = input("Type 'Y' to proceed to check the next well volume. "
-                                   "Type 'A' to skip remaining well volume checks: ")
-                if user_input.strip().upper() == 'A':
-                    return
-                while user_input.strip().upper() != 'Y':
-                    print("Invalid input. Please type 'Y' to proceed.")
-                    user_input = input("Type 'Y' to proceed: ")
-
-v = Verifier("../../data/filtration.json")
-v.verify()
+        Prints a warning for every offending well and returns them all.
+        :param interactive: ask for confirmation after each warning, or 'A' to skip the rest
+        :param bottom_correction: account for v and u shaped bottoms instead of assuming flat
+        :param tolerance: volume in µL a well may exceed its physical max by
+        :return: list of {"well", "totalLiquidVolume", "maxVolume"} dictionaries
+        """
+        violations = self.volume_violations(bottom_correction, tolerance)
+        for violation in violations:
+            print(f"Warning: Well {violation['well']} volume exceeds physical limits. "
+                  "Double check well height, diameter, and volume.")
+            if not interactive:
+                continue
+            user_input = input("Type 'Y' to proceed to check the next well volume. "
+                               "Type 'A' to skip remaining well volume checks: ")
+            if user_input.strip().upper() == 'A':
+                break
+            while user_input.strip().upper() != 'Y':
+                print("Invalid input. Please type 'Y' to proceed.")
+                user_input = input("Type 'Y' to proceed: ")
+        return violations
+
+    def volume_violations(self, bottom_correction=False, tolerance=15):
+        """
+        Compare the volume of every well with its physical max in one pass, without printing.
+        :return: list of {"well", "totalLiquidVolume", "maxVolume"} dictionaries
+        """
+        geometry = self.geometry
+        max_volumes = geometry.physical_volumes(bottom_correction)
+        volumes = geometry.columns["totalLiquidVolume"]
+        return [{"well": geometry.names[i],
+                 "totalLiquidVolume": geometry.value("totalLiquidVolume", i),
+                 "maxVolume": round(max_volume, 2)}
+                for i, (volume, max_volume) in enumerate(zip(volumes, max_volumes))
+                if volume > max_volume + tolerance]
+
+def main():
+    v = Verifier(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                              "filtration.json"))
+    v.verify()
+
+if __name__ == "__main__":
+    main()
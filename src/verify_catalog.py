@@ -0,0 +1,155 @@
+"""
+Verify a whole catalog of labware definitions in parallel, skipping files that have not changed.
+
+Usage: python -m src.verify_catalog data --json report.json --junit report.xml
+"""
+import argparse
+import hashlib
+import json
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .atomic_io import atomic_write, write_json_atomic
+from .generate_catalog import find_files
+from .pipettes import PIPETTES
+from .verifier import Verifier
+
+DEFAULT_CACHE_PATH = Path(".verify_cache.json")
+
+def verifier_version():
+    """
+    Hash of the verification code, so cached results are dropped when a check changes.
+    """
+    digest = hashlib.sha256()
+    for module in ("verifier.py", "labware_geometry.py", "pipettes.py",
+                   "verify_catalog.py"):
+        digest.update((Path(__file__).parent / module).read_bytes())
+    return digest.hexdigest()
+
+def verify_file(path, content_hash, pipettes=()):
+    """
+    Run every check on one definition, collecting all findings and the time each check took.
+    Runs in a worker process. Volume violations are reported as warnings, not failures.
+    :param pipettes: pipette names to check reach and multichannel spacing for
+    :return: result dictionary with one entry per check
+    """
+    verifier = Verifier(str(path))
+    try:
+        findings = verifier.verify(collect_errors=True, pipettes=pipettes)
+    except (ValueError, KeyError, TypeError) as e:
+        # the definition could not be loaded, so no check could run
+        message = str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"
+        findings = [{"check": "load", "severity": "error", "message": message}]
+
+    checks = []
+    for name, seconds in verifier.timings.items():
+        messages = [finding for finding in findings if finding["check"] == name]
+        if any(finding["severity"] == "error" for finding in messages):
+            status = "failed"
+        elif messages:
+            status = "warning"
+        else:
+            status = "passed"
+        checks.append({"name": name, "status": status, "seconds": seconds,
+                       "message": "\n".join(finding["message"] for finding in messages) or None})
+
+    passed = not any(finding["severity"] == "error" for finding in findings)
+    return {"path": str(path), "hash": content_hash, "passed": passed, "cached": False,
+            "checks": checks, "findings": findings}
+
+def verify_catalog(inputs, workers=None, cache_path=DEFAULT_CACHE_PATH, pipettes=()):
+    """
+    Verify every JSON definition in inputs, reusing cached results for files whose content
+    and verification code are unchanged.
+    :param inputs: JSON files, directories or glob patterns
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param cache_path: where results are cached between runs, or None to disable the cache
+    :param pipettes: pipette names to check every definition against
+    :return: list of result dictionaries, one per file, in path order
+    """
+    version = verifier_version()
+    cache = {}
+    if cache_path is not None and Path(cache_path).exists():
+        with open(cache_path, encoding="utf-8") as file:
+            stored = json.load(file)
+        if stored.get("version") == version:
+            cache = stored["results"]
+
+    results = {}
+    jobs = []
+    for path in find_files(inputs, "*.json"):
+        content_hash = hashlib.sha256(path.read_bytes()).hexdigest()
+        cached = cache.get(f"{content_hash}:{','.join(pipettes)}")
+        if cached is not None:
+            results[path] = dict(cached, path=str(path), cached=True)
+        else:
+            jobs.append((path, content_hash, tuple(pipettes)))
+
+    if workers == 1 or len(jobs) <= 1:
+        fresh = [verify_file(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fresh = list(pool.map(verify_file, *zip(*jobs)))
+    for (path, _, _), result in zip(jobs, fresh):
+        results[path] = result
+        cache[f"{result['hash']}:{','.join(pipettes)}"] = result
+
+    if cache_path is not None:
+        write_json_atomic(cache_path, {"version": version, "results": cache}, "compact")
+    return [results[path] for path in sorted(results)]
+
+def write_junit(results, path):
+    """
+    Write the results as a JUnit XML report, with one test case per file and check.
+    """
+    suite = ET.Element("testsuite", name="labware-verification")
+    total = failures = 0
+    seconds = 0.0
+    for result in results:
+        for check in result["checks"]:
+            total += 1
+            seconds += check["seconds"]
+            case = ET.SubElement(suite, "testcase", classname=result["path"], name=check["name"],
+                                 time=f"{check['seconds']:.6f}")
+            if check["status"] == "failed":
+                failures += 1
+                ET.SubElement(case, "failure", message=check["message"])
+            elif check["status"] == "warning":
+                ET.SubElement(case, "system-out").text = check["message"]
+    suite.set("tests", str(total))
+    suite.set("failures", str(failures))
+    suite.set("time", f"{seconds:.6f}")
+    with atomic_write(path, "wb") as file:
+        ET.ElementTree(suite).write(file, encoding="utf-8", xml_declaration=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify labware definitions.")
+    parser.add_argument("inputs", nargs="+", help="JSON definitions, directories or glob patterns")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH,
+                        help="file to cache results in between runs")
+    parser.add_argument("--no-cache", action="store_true", help="verify every file again")
+    parser.add_argument("-p", "--pipette", action="append", default=[], choices=list(PIPETTES),
+                        help="also check reach and nozzle spacing for this pipette; repeatable")
+    parser.add_argument("--json", type=Path, help="write a JSON report to this file")
+    parser.add_argument("--junit", type=Path, help="write a JUnit XML report to this file")
+    args = parser.parse_args(argv)
+
+    results = verify_catalog(args.inputs, args.workers, None if args.no_cache else args.cache,
+                             args.pipette)
+    if args.json is not None:
+        write_json_atomic(args.json, results)
+    if args.junit is not None:
+        write_junit(results, args.junit)
+
+    for result in results:
+        print(f"{result['path']}: {'ok' if result['passed'] else 'FAILED'}"
+              f"{' (cached)' if result['cached'] else ''}")
+        for finding in result["findings"]:
+            if finding["severity"] == "error":
+                print(f"    {finding['check']}: {finding['message']}")
+    return 0 if all(result["passed"] for result in results) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+from array import array
+from .labels import get_labels
+
+class GridGeometry:
+    """
+    Coordinates of one regular grid of wells, computed per axis in a single pass.
+    x only depends on the column and y only on the row, so each is rounded once per
+    column/row instead of once per well. Well dicts are only built by to_wells().
+    """
+    __slots__ = ("row_labels", "cols", "x", "y", "z")
+
+    def __init__(self, rows, cols, x_offset, y_offset, x_spacing, y_spacing, zDimension,
+                 well_depth, start_row_index=0):
+        """
+        :param start_row_index: index of the first row label, for grids stacked below others
+        """
+        self.row_labels = get_labels(start_row_index, rows)
+        self.cols = cols
+        self.x = [round(x_offset + col * x_spacing, 2) for col in range(cols)]
+        self.y = [round(y_offset + (rows - row - 1) * y_spacing, 2) for row in range(rows)]
+        self.z = round(zDimension - well_depth, 2)
+
+    @property
+    def rows(self):
+        return len(self.row_labels)
+
+    def names(self, column_major=False):
+        """
+        Well names of the grid, row by row or column by column.
+        """
+        if column_major:
+            return [f"{label}{col}" for col in range(1, self.cols + 1)
+                    for label in self.row_labels]
+        return [f"{label}{col}" for label in self.row_labels
+                for col in range(1, self.cols + 1)]
+
+    def cells(self, column_major=False):
+        """
+        Well names with their x and y coordinates, as three lists in the same order as names().
+        """
+        if column_major:
+            xs = [x for x in self.x for _ in self.y]
+            ys = self.y * self.cols
+        else:
+            xs = self.x * self.rows
+            ys = [y for y in self.y for _ in self.x]
+        return self.names(column_major), xs, ys
+
+    def arrays(self, column_major=False):
+        """
+        Per-well x, y and z coordinates as typed arrays, in the same order as names().
+        """
+        _, xs, ys = self.cells(column_major)
+        return array('d', xs), array('d', ys), array('d', [self.z]) * len(xs)
+
+    def to_wells(self, well, column_major=False):
+        """
+        Build the well dicts of the grid.
+        :param well: the fields shared by every well (depth, volume, shape and size)
+        :return: dictionary of well name to well definition, in the same order as names()
+        """
+        z = self.z
+        wells = {}
+        if column_major:
+            for col, x in enumerate(self.x, start=1):
+                for label, y in zip(self.row_labels, self.y):
+                    wells[f"{label}{col}"] = {**well, "x": x, "y": y, "z": z}
+        else:
+            for label, y in zip(self.row_labels, self.y):
+                for col, x in enumerate(self.x, start=1):
+                    wells[f"{label}{col}"] = {**well, "x": x, "y": y, "z": z}
+        return wells
@@ -1,9 +1,32 @@
-import json
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 from opentrons import protocol_api, types
 
+sys.path.append(str(Path("..")))
+from src.labware_store import load_labware
+from src.status_generator import WellAllocator
+from src.status_store import journal_path
+
 metadata = {'apiLevel': '2.16'}
 
+LABWARE_PATH = Path("../data/filtration.json")
+STATUS_PATH = Path("../data/filtration_status.json")
+
+def copy_status(directory):
+    """
+    Copy the status file and its journal into directory, so a simulation can allocate wells
+    without using them up on the real plate.
+    :return: path of the copied status file
+    """
+    status_path = Path(directory) / STATUS_PATH.name
+    for source, target in ((STATUS_PATH, status_path),
+                           (journal_path(STATUS_PATH), journal_path(status_path))):
+        if source.exists():
+            shutil.copyfile(source, target)
+    return status_path
+
 def run(protocol: protocol_api.ProtocolContext):
 
     # Load pipette
@@ -12,15 +35,7 @@ def run(protocol: protocol_api.ProtocolContext):
     # Load labware
     tiprack = protocol.load_labware('opentrons_96_tiprack_1000ul', '1')
     wellplate = protocol.load_labware('corning_24_wellplate_3.4ml_flat', '2')
-    path = Path("../data/filtration.json")
-    with open(path, encoding="utf-8") as file:
-        filtration_file = json.load(file)
-    filtration_plate = protocol.load_labware_from_definition(filtration_file, '3')
-
-    # Load status
-    path = Path("../data/filtration_status.json")
-    with open(path, encoding="utf-8") as file:
-        filtration_status = json.load(file)
+    filtration_plate = load_labware(protocol, LABWARE_PATH, '3')
 
     # Load liquid
     slurry = protocol.define_liquid(name='slurry', description='', display_color='#000000')
@@ -28,30 +43,35 @@ def run(protocol: protocol_api.ProtocolContext):
     for well in wells_to_load:
         wellplate[well].load_liquid(slurry, 1000)
 
-    pipette.pick_up_tip(tiprack['A1'])
-
-    # Find first CLEAN well and dispense
-    clean_well_found = False
-    current_well = None
-    for well in filtration_status:
-        if filtration_status[well] == "CLEAN":
-            clean_well_found = True
-            current_well = well
-            pipette.aspirate(500, wellplate['A1'])
-            pipette.dispense(500, filtration_plate[current_well])
-            filtration_status[current_well] = "ONGOING"
-            break
+    # Load status; every change is journaled to disk as soon as it is made.
+    # A simulation works on a copy that is thrown away at the end.
+    scratch = tempfile.TemporaryDirectory() if protocol.is_simulating() else None
+    status_path = STATUS_PATH if scratch is None else copy_status(scratch.name)
+    # Each well drains into the well three rows above it.
+    filtration_status = WellAllocator(LABWARE_PATH, status_path, pair_rows=-3)
+    try:
+        filtration_status.open()
+        pipette.pick_up_tip(tiprack['A1'])
 
-    if not clean_well_found:
-        raise RuntimeError("Error: No clean well found. Ending protocol.")
+        # Take the first CLEAN well whose drain well is CLEAN too, and dispense
+        try:
+            (current_well, filtered_well), = filtration_status.allocate_pairs()
+        except RuntimeError:
+            raise RuntimeError("Error: No clean well found. Ending protocol.")
+        pipette.aspirate(500, wellplate['A1'])
+        pipette.dispense(500, filtration_plate[current_well])
 
-    # Replace tip
-    pipette.drop_tip()
-    pipette.pick_up_tip(tiprack['B1'])
+        # Replace tip
+        pipette.drop_tip()
+        pipette.pick_up_tip(tiprack['B1'])
 
-    # Aspirate filtered liquid and update status to USED
-    pipette.aspirate(500, filtration_plate[chr(ord(current_well[0]) - 3) + current_well[1]])
-    pipette.dispense(500, wellplate['A2'])
-    filtration_status[current_well] = "USED"
+        # Aspirate filtered liquid and update status to USED
+        pipette.aspirate(500, filtration_plate[filtered_well])
+        pipette.dispense(500, wellplate['A2'])
+        filtration_status.mark_used([current_well, filtered_well])
+    finally:
+        filtration_status.close()
+        if scratch is not None:
+            scratch.cleanup()
 
     pipette.drop_tip()
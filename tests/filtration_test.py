@@ -1,7 +1,10 @@
-import json
+import sys
 from pathlib import Path
 from opentrons import protocol_api, types
 
+sys.path.append(str(Path("..")))
+from src.labware_store import load_labware
+
 metadata = {'apiLevel': '2.16'}
 
 def run(protocol: protocol_api.ProtocolContext):
@@ -12,10 +15,7 @@ def run(protocol: protocol_api.ProtocolContext):
     # Load labware
     tiprack = protocol.load_labware('opentrons_96_tiprack_1000ul', '1')
     wellplate = protocol.load_labware('corning_24_wellplate_3.4ml_flat', '2')
-    path = Path("../data/filtration.json")
-    with open(path, encoding="utf-8") as file:
-        filtration_file = json.load(file)
-    filtration_plate = protocol.load_labware_from_definition(filtration_file, '3')
+    filtration_plate = load_labware(protocol, Path("../data/filtration.json"), '3')
 
     # Load liquid
     slurry = protocol.define_liquid(name='slurry', description='', display_color='#000000')
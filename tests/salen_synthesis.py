@@ -1,13 +1,14 @@
-import json
+import sys
 from pathlib import Path
 from opentrons import protocol_api, types
 
+sys.path.append(str(Path("..")))
+from src.labware_store import load_labware
+
 metadata = {'apiLevel': '2.16'}
 
 def load_labware_from_json(protocol, file_path, slot):
-    with open(file_path, encoding="utf-8") as file:
-        labware_file = json.load(file)
-    return protocol.load_labware_from_definition(labware_file, slot)
+    return load_labware(protocol, file_path, slot)
 
 def transfer(pipette, volume, source_zone, target_zone, new_tip=False, tip=None, return_tip=False):
     if new_tip: